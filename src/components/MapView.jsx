@@ -101,10 +101,18 @@ const LABEL_TILES = [
 
 const EMPTY_FC = { type: "FeatureCollection", features: [] };
 
+// Coarser geometry drawn below LOD_MAX_ZOOM (written by the builder's --lod)
+const LOD_URL = "/campus.lod2m.geojson";
+const LOD_MAX_ZOOM = 16;
+
 const setFilterSafe = (map, layerId, f) => {
   map.setFilter(layerId, f ?? ["all"]);
 };
 
+// Features arrive in spatial (Hilbert) order; draw larger areas first so
+// children stay on top of their parents.
+const fillSortLayout = { "fill-sort-key": ["-", ["get", "area"]] };
+
 const withBase = (base, extra) => [
   "all",
   ...(base ? [base] : []),
@@ -112,6 +120,11 @@ const withBase = (base, extra) => [
 ];
 
 function featureBounds(f) {
+  // Built data carries a precomputed [west, south, east, north]
+  const bbox = f.properties.bbox;
+  if (Array.isArray(bbox)) {
+    return new maplibregl.LngLatBounds([bbox[0], bbox[1]], [bbox[2], bbox[3]]);
+  }
   const b = new maplibregl.LngLatBounds();
   const polys =
     f.geometry.type === "Polygon"
@@ -339,7 +352,13 @@ export default function MapView({
       });
       map.addLayer({ id: "basemap", type: "raster", source: "basemap" });
 
-      // campus data
+      // campus data; the prebuilt search index downloads alongside it
+      const searchIndexReq = fetch("/campus.search.json")
+        .then((r) => (r.ok ? r.json() : null))
+        .catch(() => null);
+      const lodReq = fetch(LOD_URL)
+        .then((r) => (r.ok ? r.json() : null))
+        .catch(() => null);
       const res = await fetch("/campus.geojson");
       const data = await res.json();
 
@@ -381,11 +400,39 @@ export default function MapView({
       if (trainingModeRef.current) startTrainingRound();
       map.addSource("campus", { type: "geojson", data });
 
+      // Below LOD_MAX_ZOOM the source draws the coarser level of detail. Only
+      // geometry is swapped, so filters and hit testing see the same features
+      // and (client-adjusted) properties either way.
+      let lodData = null;
+      let showingLod = false;
+      const syncLod = () => {
+        const wantLod = lodData !== null && map.getZoom() < LOD_MAX_ZOOM;
+        if (wantLod === showingLod) return;
+        showingLod = wantLod;
+        map.getSource("campus")?.setData(wantLod ? lodData : data);
+      };
+      lodReq.then((lod) => {
+        if (!lod) return;
+        const geomById = new Map(
+          lod.features.map((f) => [f.properties.id, f.geometry])
+        );
+        lodData = {
+          ...data,
+          features: data.features.map((f) => ({
+            ...f,
+            geometry: geomById.get(f.properties.id) ?? f.geometry,
+          })),
+        };
+        syncLod();
+      });
+      map.on("zoomend", syncLod);
+
       // building layers
       map.addLayer({
         id: "bldg-fill",
         type: "fill",
         source: "campus",
+        layout: fillSortLayout,
         paint: buildingFillPaint,
       });
       map.addLayer({
@@ -458,6 +505,7 @@ export default function MapView({
             id: "bldg-fill",
             type: "fill",
             source: "campus",
+            layout: fillSortLayout,
             paint: { "fill-color": fill, "fill-opacity": 0.25 },
           });
         } else {
@@ -538,15 +586,28 @@ export default function MapView({
         );
       });
 
-      // Fuse index for search
-      setFuse(
-        new Fuse(data.features, {
-          keys: ["properties.name", "properties.aliases"],
-          threshold: 0.3,
-          ignoreLocation: true,
-          minMatchCharLength: 2,
-        })
-      );
+      // Fuse index for search: prefer the one prebuilt by the data build,
+      // falling back to indexing here if it is missing or out of step
+      searchIndexReq.then((searchIndex) => {
+        const ids = searchIndex?.ids;
+        const prebuilt =
+          ids?.length === data.features.length &&
+          ids.every((id, i) => id === data.features[i].properties.id)
+            ? Fuse.parseIndex(searchIndex)
+            : undefined;
+        setFuse(
+          new Fuse(
+            data.features,
+            {
+              keys: ["properties.name", "properties.aliases"],
+              threshold: 0.3,
+              ignoreLocation: true,
+              minMatchCharLength: 2,
+            },
+            prebuilt
+          )
+        );
+      });
 
       // choose the smallest-area feature to prefer children over parents
       const smallestFeature = (features) =>
@@ -697,7 +758,8 @@ export default function MapView({
       (x) => x.properties.id === selectedId
     );
     if (f) {
-      const center = featureBounds(f).getCenter();
+      // the label point is always inside the shape, unlike the bbox centre
+      const center = f.properties.label ?? featureBounds(f).getCenter();
       map.easeTo({ center, zoom: 17, duration: 800 });
       setStatus(`Selected: ${f.properties.name}`);
     }
@@ -0,0 +1,301 @@
+import argparse
+import contextlib
+import copy
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .builder import assign_parent_child, process_features
+from .classification import determine_category
+from .geometry import build_geometries
+from .state import BuildState
+from .synthetic import generate_osm
+from .writer import write_single
+
+BASELINE_FILE: Path = (
+    Path(__file__).resolve().parent.parent / "bench" / "baseline.json"
+)
+DEFAULT_SCALES: List[float] = [1, 10, 100]
+REGRESSION_RATIO: float = 1.25  # flag cases this much slower than baseline
+DEFAULT_REPEAT: int = 3  # timed runs per stage; the fastest is reported
+
+
+def _measure(
+    func: Callable[..., Any],
+    memory: bool,
+    setup: Optional[Callable[[], Any]] = None,
+    repeat: int = DEFAULT_REPEAT,
+) -> Tuple[float, Optional[int], Any]:
+    """Run ``func`` with its output silenced; return seconds, peak bytes, result.
+
+    ``setup``, when given, runs untimed before every call and its result is
+    passed to ``func``. The fastest of ``repeat`` runs, each with the garbage
+    collector paused, is reported.
+    """
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        seconds = float("inf")
+        result = None
+        for _ in range(max(repeat, 1)):
+            args = (setup(),) if setup else ()
+            # As timeit does: collections triggered by earlier runs' garbage
+            # would otherwise land in whichever stage happens to be running.
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                result = func(*args)
+                seconds = min(seconds, time.perf_counter() - start)
+            finally:
+                gc.enable()
+        peak = None
+        if memory:
+            # A separate, traced run: tracemalloc would distort the timing.
+            args = (setup(),) if setup else ()
+            tracemalloc.start()
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return seconds, peak, result
+
+
+def bench_scale(
+    scale: float, memory: bool = True, repeat: int = DEFAULT_REPEAT
+) -> Dict[str, Dict[str, Any]]:
+    """Time each pipeline stage on synthetic data ``scale`` times UCLA."""
+    data = generate_osm(scale)
+    n_elements = sum(1 for el in data["elements"] if el["type"] != "node")
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def record(
+        name: str,
+        func: Callable[..., Any],
+        items: int,
+        setup: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        seconds, peak, result = _measure(func, memory, setup, repeat)
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "items": items,
+            "per_second": round(items / seconds, 1) if seconds else None,
+            "peak_bytes": peak,
+        }
+        return result
+
+    record("build_geometries", lambda: build_geometries(data), n_elements)
+    features = record(
+        "process_features", lambda: process_features(data), n_elements
+    )
+    record(
+        "assign_parent_child",
+        assign_parent_child,
+        len(features),
+        setup=lambda: copy.deepcopy(features),
+    )
+    tags = [
+        {
+            **el.get("tags", {}),
+            "name": el.get("tags", {}).get("name", ""),
+            "zone": "Center Campus",
+            "id": el["id"],
+        }
+        for el in data["elements"]
+        if el["type"] != "node"
+    ]
+    record(
+        "determine_category",
+        lambda: [determine_category(t) for t in tags],
+        len(tags),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            # Start each run from an empty public/ so unchanged-file skipping
+            # does not turn repeats into no-ops.
+            record(
+                "write_single",
+                lambda _: write_single(features),
+                len(features),
+                setup=lambda: shutil.rmtree("public", ignore_errors=True),
+            )
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def _comparable(features: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    out = []
+    for f in features:
+        props = {k: v for k, v in f["properties"].items() if k != "updated_at"}
+        out.append(json.loads(json.dumps({**f, "properties": props})))
+    return out
+
+
+def check_incremental(scale: float = 1.0) -> List[str]:
+    """Compare an incremental rebuild after relation edits with a full one.
+
+    Inner members of the synthetic relations are tagged as buildings, built
+    once into a state, then released from their relations. The incremental
+    rebuild must produce the same features as a stateless build. Returns the
+    ids that differ.
+    """
+    data = generate_osm(scale)
+    inner = {
+        m["ref"]
+        for el in data["elements"]
+        if el["type"] == "relation"
+        for m in el["members"]
+        if m["role"] == "inner"
+    }
+    for el in data["elements"]:
+        if el["type"] == "way" and el["id"] in inner:
+            el["tags"] = {"building": "yes", "name": f"Inner {el['id']}"}
+    edited = copy.deepcopy(data)
+    for el in edited["elements"]:
+        if el["type"] == "relation":
+            el["members"] = [m for m in el["members"] if m["role"] != "inner"]
+            el["version"] = el.get("version", 1) + 1
+
+    state = BuildState()
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_features(copy.deepcopy(data), state)
+        incremental = _comparable(process_features(copy.deepcopy(edited), state))
+        full = _comparable(process_features(copy.deepcopy(edited), BuildState()))
+    by_id = {f["properties"]["id"]: f for f in full}
+    inc_ids = {f["properties"]["id"] for f in incremental}
+    return sorted(
+        {fid for fid in by_id if fid not in inc_ids}
+        | {
+            f["properties"]["id"]
+            for f in incremental
+            if by_id.get(f["properties"]["id"]) != f
+        }
+    )
+
+
+def compare(
+    current: Dict[str, Any], baseline: Dict[str, Any]
+) -> List[Tuple[str, str, float]]:
+    """Return (scale, stage, ratio) for every case slower than the baseline."""
+    slower = []
+    for scale, stages in current["scales"].items():
+        for stage, result in stages.items():
+            base = baseline.get("scales", {}).get(scale, {}).get(stage)
+            if not base or not base.get("seconds"):
+                continue
+            ratio = result["seconds"] / base["seconds"]
+            if ratio > REGRESSION_RATIO:
+                slower.append((scale, stage, ratio))
+    return slower
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the build pipeline on synthetic OSM data"
+    )
+    parser.add_argument(
+        "--scales",
+        type=float,
+        nargs="+",
+        default=DEFAULT_SCALES,
+        help="dataset sizes as multiples of the UCLA extract (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="timed runs per stage, keeping the fastest (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="skip the tracemalloc pass that measures peak memory",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE_FILE,
+        help="baseline JSON to compare against (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="store this run as the new baseline",
+    )
+    parser.add_argument("--output", type=Path, help="also write this run as JSON")
+    parser.add_argument(
+        "--check-incremental",
+        action="store_true",
+        help="only check that incremental rebuilds match full rebuilds",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.check_incremental:
+        for scale in args.scales:
+            differ = check_incremental(scale)
+            print(f"{scale:g}x: {len(differ)} feature(s) differ from a full rebuild")
+            for fid in differ[:20]:
+                print(f"  {fid}")
+            if differ:
+                return 1
+        return 0
+    run: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "scales": {},
+    }
+    for scale in args.scales:
+        label = f"{scale:g}x"
+        print(f"Benchmarking {label}...")
+        run["scales"][label] = bench_scale(
+            scale, memory=not args.no_memory, repeat=args.repeat
+        )
+        for stage, result in run["scales"][label].items():
+            peak = result["peak_bytes"]
+            mem = f", peak {peak / 2**20:.1f} MB" if peak is not None else ""
+            print(
+                f"  {stage}: {result['seconds']:.3f}s "
+                f"({result['per_second']}/s{mem})"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+            f.write("\n")
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+            f.write("\n")
+        print(f"Stored baseline in {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --update-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    slower = compare(run, baseline)
+    for scale, stage, ratio in slower:
+        print(f"  Slower than baseline: {scale} {stage} ({ratio:.2f}x)")
+    if not slower:
+        print("No stage is slower than the baseline")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,22 +1,49 @@
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
-from typing import Any, Dict, List
+from itertools import repeat
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
-from shapely.geometry import MultiPolygon, Polygon, mapping, shape
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import MultiPolygon, Polygon, box, mapping, shape
 from shapely.geometry.base import BaseGeometry
 from shapely.geometry.polygon import orient
-from shapely.ops import transform, unary_union
+from shapely.ops import unary_union
 
-from .classification import determine_category, determine_zone
+from .classification import (
+    current_stats,
+    determine_category,
+    determine_zones,
+    disable_stats,
+    enable_stats,
+)
 from .constants import (
-    _TO_M,
+    BBOX,
     BLACKLIST,
     EXCLUDE_BUILDINGS,
+    LABEL_TOLERANCE_M,
+    LOD_TOLERANCES_M,
     MIN_AREA_EXCLUDE,
     MIN_AREA_UNNAMED,
+    PARALLEL_MIN_SOURCES,
     SINGLE_TOLERANCE_M,
 )
-from .geometry import build_geometries, simplify_geom_m
+from .geometry import (
+    ElementKey,
+    assemble_geometries,
+    hilbert_order,
+    index_elements,
+    label_points_m,
+    simplify_coverage_m,
+    to_degrees,
+    to_metres,
+)
+from .metrics import stage
+from .state import BuildState, element_fingerprints, pipeline_signature
 from .utils import hash_centroid, slugify
 
 # Minimum child area to consider for subset detection (m²)
@@ -28,6 +55,28 @@ OVERLAP_THRESHOLD: float = 0.60
 CAMPUS_WAY_ID: int = 807458549
 
 
+@dataclass
+class FeatureRecord:
+    """A feature under construction.
+
+    Carries the source geometry in WGS84 and EPSG:3310 side by side so that
+    each stage reuses the projection instead of running pyproj again.
+    """
+
+    props: Dict[str, Any]
+    geom: BaseGeometry
+    geom_m: BaseGeometry
+    view: Optional[BaseGeometry] = None
+    view_m: Optional[BaseGeometry] = None
+
+    def to_feature(self) -> Dict[str, Any]:
+        return {
+            "type": "Feature",
+            "properties": self.props,
+            "geometry": mapping(self.view),
+        }
+
+
 def _outer_shell(geom: BaseGeometry) -> BaseGeometry:
     if isinstance(geom, Polygon):
         return Polygon(geom.exterior)
@@ -36,8 +85,17 @@ def _outer_shell(geom: BaseGeometry) -> BaseGeometry:
     return geom
 
 
-def assign_parent_child(features: List[Dict[str, Any]]) -> int:
-    geoms_m = [transform(_TO_M, shape(f["geometry"])) for f in features]
+def assign_parent_child(
+    features: List[Dict[str, Any]],
+    geoms_m: Optional[Sequence[BaseGeometry]] = None,
+) -> int:
+    """Mark contained features as children of their largest named container.
+
+    ``geoms_m`` are the feature geometries already projected to EPSG:3310; when
+    omitted they are parsed and projected from the features themselves.
+    """
+    if geoms_m is None:
+        geoms_m = to_metres(np.array([shape(f["geometry"]) for f in features]))
     areas = [g.area for g in geoms_m]
     centroids = [g.centroid for g in geoms_m]
     names = [f["properties"]["name"] for f in features]
@@ -46,6 +104,12 @@ def assign_parent_child(features: List[Dict[str, Any]]) -> int:
     indices = sorted(
         range(len(features)), key=lambda i: areas[i], reverse=True
     )
+    rank = {j: r for r, j in enumerate(indices)}
+
+    # Candidate parents are limited to shells whose bounding box meets the
+    # child's bounding box grown by SUBSET_BUFFER_M; only those pairs can have
+    # a non-zero (buffered) overlap.
+    tree = STRtree(outer_shells)
 
     renamed = 0
     for i in indices:
@@ -53,8 +117,15 @@ def assign_parent_child(features: List[Dict[str, Any]]) -> int:
         area_a = areas[i]
         if area_a < MIN_CHILD_AREA:
             continue
+        minx, miny, maxx, maxy = geom_a.bounds
+        search = box(
+            minx - SUBSET_BUFFER_M,
+            miny - SUBSET_BUFFER_M,
+            maxx + SUBSET_BUFFER_M,
+            maxy + SUBSET_BUFFER_M,
+        )
         candidates = []
-        for j in indices:
+        for j in sorted(tree.query(search).tolist(), key=rank.__getitem__):
             if i == j or names[j].startswith("Unnamed "):
                 continue
             outer_b = outer_shells[j]
@@ -96,8 +167,220 @@ def assign_parent_child(features: List[Dict[str, Any]]) -> int:
     return renamed
 
 
-def process_features(osm_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _build_props(
+    el: Dict[str, Any],
+    A: float,
+    centroid: List[float],
+    main_campus: bool,
+    zone: str,
+) -> Optional[Dict[str, Any]]:
+    osm_id = el["id"]
+    tags = el.get("tags", {})
+    building_type = (tags.get("building") or "").lower()
+
+    name = (
+        tags.get("name")
+        or tags.get("official_name")
+        or tags.get("alt_name")
+        or tags.get("loc_name")
+        or tags.get("ref")
+        or tags.get("operator")
+    )
+    if not name:
+        feature_type = (
+            tags.get("natural")
+            or tags.get("leisure")
+            or tags.get("landuse")
+            or building_type
+            or tags.get("amenity")
+            or "feature"
+        ).lower()
+        if feature_type == "yes":
+            feature_type = "building"
+        feature_type = feature_type.replace("_", " ")
+        name = f"Unnamed {feature_type.title()}"
+
+    if name.startswith("Unnamed ") and A < MIN_AREA_UNNAMED:
+        return None
+    if building_type in EXCLUDE_BUILDINGS and A < MIN_AREA_EXCLUDE:
+        return None
+    if A < MIN_AREA_EXCLUDE and name.startswith("Unnamed "):
+        return None
+    if any(re.search(pattern, name, re.I) for pattern in BLACKLIST):
+        return None
+    if name.startswith("Unnamed "):
+        amenity = (tags.get("amenity") or "").lower()
+        parking = (tags.get("parking") or "").lower()
+        bldg = (tags.get("building") or "").lower()
+        if (
+            amenity == "parking"
+            or bldg == "parking"
+            or parking in {"multi-storey", "underground"}
+        ):
+            ref = (tags.get("ref") or "").strip()
+            m = re.search(
+                r"(?:^|[^0-9])([Pp]?\s*\d{1,2})(?:[^0-9]|$)", ref
+            )
+            if m:
+                num = re.sub(r"[^\d]", "", m.group(1))
+                name = f"Parking Structure {num}"
+            else:
+                name = "Parking Structure"
+
+    aliases = []
+    for k in ("alt_name", "short_name", "old_name"):
+        if tags.get(k):
+            aliases += [a.strip() for a in tags[k].split(";")]
+    if tags.get("ref"):
+        aliases.append(tags["ref"])
+    aliases = list(
+        {
+            a.strip(): None
+            for a in aliases
+            if a and a.strip().lower() != name.lower()
+        }.keys()
+    )
+
+    category = determine_category(
+        {**tags, "name": name, "zone": zone, "id": osm_id}
+    )
+
+    fid = f"{slugify(name)}-{hash_centroid(centroid)}"
+    props = {
+        "id": fid,
+        "name": name,
+        "aliases": aliases,
+        "zone": zone,
+        "category": category,
+        "centroid": centroid,
+        "osm_id": osm_id,
+        "area": round(A, 2),
+        "main_campus": main_campus,
+        "overlap_role": "solo",
+        "updated_at": datetime.now(timezone.utc)
+        .isoformat()
+        .replace("+00:00", "Z"),
+    }
+
+    name_norm = name.strip().lower()
+    if name_norm in {"ucla", "university of california, los angeles"} and (
+        tags.get("amenity") == "university"
+        or tags.get("landuse") == "university"
+    ):
+        props["render"] = False
+
+    if props.get("render") is not False:
+        props["render"] = True
+
+    return props
+
+
+PropsInput = Tuple[Dict[str, Any], float, List[float], bool, str]
+
+
+def _build_props_chunk(
+    chunk: List[PropsInput], collect_stats: bool = False
+) -> Tuple[List[Optional[Dict[str, Any]]], Any]:
+    # Classification stats recorded in a worker are sent back for merging.
+    if collect_stats:
+        enable_stats()
+    props = [_build_props(*item) for item in chunk]
+    return props, disable_stats() if collect_stats else None
+
+
+def _spatial_classes(
+    geoms: np.ndarray,
+    geoms_m: np.ndarray,
+    campus_geom_m: Optional[BaseGeometry],
+) -> Tuple[List[List[float]], List[bool], List[str]]:
+    """Return the rounded centroid, main_campus flag and zone of each feature.
+
+    Runs as one batch: the campus polygon is prepared once and tested against
+    every geometry in a single call, and zones come from the ZONE_RULES table
+    evaluated over the centroid array.
+    """
+    xy = shapely.get_coordinates(shapely.centroid(geoms))
+    # Python's round() keeps the ids and centroids identical to earlier
+    # builds; numpy rounding can differ in the last digit.
+    centroids = [[round(x, 6), round(y, 6)] for x, y in xy.tolist()]
+    if campus_geom_m is not None and len(geoms_m):
+        shapely.prepare(campus_geom_m)
+        main_campus = shapely.intersects(geoms_m, campus_geom_m)
+    else:
+        main_campus = np.zeros(len(geoms_m), dtype=bool)
+    zones = determine_zones(np.array(centroids), main_campus)
+    return centroids, main_campus.tolist(), zones
+
+
+def _build_all_props(
+    items: List[PropsInput], workers: int = 1
+) -> List[Optional[Dict[str, Any]]]:
+    """Run _build_props over ``items``, on a process pool when worthwhile.
+
+    ``workers`` of 0 means one per CPU. Chunks are mapped in order, so the
+    result lists line up with ``items`` exactly as a serial run would.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(items) < PARALLEL_MIN_SOURCES:
+        return [_build_props(*item) for item in items]
+    size = -(-len(items) // (workers * 4))
+    chunks = [items[i : i + size] for i in range(0, len(items), size)]
+    print(f"  Building {len(items)} features on {workers} processes")
+    try:
+        stats = current_stats()
+        results: List[Optional[Dict[str, Any]]] = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for props, chunk_stats in pool.map(
+                _build_props_chunk, chunks, repeat(stats is not None)
+            ):
+                results.extend(props)
+                if stats is not None:
+                    stats.merge(chunk_stats)
+        return results
+    except (OSError, NotImplementedError) as e:
+        # Sandboxes without working multiprocessing primitives.
+        print(f"  Process pool unavailable ({e}); building serially")
+        return [_build_props(*item) for item in items]
+
+
+def process_features(
+    osm_data: Dict[str, Any],
+    state: Optional[BuildState] = None,
+    workers: int = 1,
+    lod_tolerances: Sequence[float] = LOD_TOLERANCES_M,
+) -> List[Dict[str, Any]]:
+    """Build the campus features from Overpass data.
+
+    With a ``state``, only ways and relations whose fingerprint changed since
+    the previous build are rebuilt; everything else reuses the stored
+    per-element result. The global dedupe and parent/child passes always run
+    over the full feature set. ``workers`` above 1 (or 0 for one per CPU)
+    builds per-element properties on a process pool.
+
+    For each of ``lod_tolerances`` the source geometries are also simplified
+    together as coverages (see simplify_coverage_m) and stored per feature
+    under ``"lods"``, keyed by tolerance, for the writer to emit as coarser
+    levels of detail.
+
+    Each feature also gets a ``label`` point (the pole of inaccessibility of
+    its drawn geometry), a ``bbox`` and a ``perimeter`` in metres. Features
+    are returned in Hilbert-curve order of their centroids over BBOX, so
+    neighbours sit together in the output and keep their relative order
+    when other features come and go.
+    """
     print("Processing features...")
+    with stage("index_elements") as counts:
+        store, ways, rels, keys = index_elements(osm_data.get("elements", []))
+        counts.update(nodes=len(store.ids), ways=len(ways), relations=len(rels))
+    stale: Optional[Set[ElementKey]] = None
+    if state is not None:
+        with stage("fingerprint") as counts:
+            fingerprints = element_fingerprints(store, ways, rels)
+            counts["elements"] = len(fingerprints)
+        campus_fp = fingerprints.get(("way", CAMPUS_WAY_ID), "")
+        state.bind(pipeline_signature(campus_fp))
+        stale = state.stale(fingerprints) | {("way", CAMPUS_WAY_ID)}
+        print(f"  Rebuilding {len(stale)} of {len(fingerprints)} element(s)")
     (
         ways,
         _,
@@ -105,26 +388,31 @@ def process_features(osm_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         rel_polys,
         ways_in_building_rels,
         ways_in_multipolygon_holes,
-    ) = build_geometries(osm_data)
+    ) = assemble_geometries(store, ways, rels, stale)
     ways_to_skip = ways_in_building_rels | ways_in_multipolygon_holes
     campus_geom = way_polys.get(CAMPUS_WAY_ID)
-    campus_geom_m = transform(_TO_M, campus_geom) if campus_geom else None
-    features = []
+    campus_geom_m = to_metres(campus_geom) if campus_geom else None
 
-    elements = osm_data.get("elements", [])
-    for el in elements:
-        if el["type"] == "way" and el["id"] == CAMPUS_WAY_ID:
+    rels_by_id = {rel["id"]: rel for rel in rels}
+    results: Dict[ElementKey, Optional[FeatureRecord]] = {}
+    skipped: Set[ElementKey] = set()
+    sources = []
+    for key in keys:
+        el = ways[key[1]] if key[0] == "way" else rels_by_id[key[1]]
+        results[key] = None
+        if el["type"] == "way" and (
+            el["id"] == CAMPUS_WAY_ID or el["id"] in ways_to_skip
+        ):
+            skipped.add(key)
             continue
+        if stale is not None and key not in stale:
+            results[key] = state.get(key)
+            continue
+
         if el["type"] == "way":
-            if el["id"] in ways_to_skip:
-                continue
             geom = way_polys.get(el["id"])
-            osm_id = el['id']
-        elif el["type"] == "relation":
-            geom = rel_polys.get(el["id"])
-            osm_id = el['id']
         else:
-            continue
+            geom = rel_polys.get(el["id"])
 
         if geom is None or geom.is_empty:
             continue
@@ -133,153 +421,136 @@ def process_features(osm_data: Dict[str, Any]) -> List[Dict[str, Any]]:
             geom = orient(geom, sign=1.0)
         elif isinstance(geom, MultiPolygon):
             geom = MultiPolygon([orient(p, sign=1.0) for p in geom.geoms])
+        sources.append((key, el, geom))
 
-        geom_m = transform(_TO_M, geom)
-        A = geom_m.area
-        tags = el.get("tags", {})
-        building_type = (tags.get("building") or "").lower()
-
-        name = (
-            tags.get("name")
-            or tags.get("official_name")
-            or tags.get("alt_name")
-            or tags.get("loc_name")
-            or tags.get("ref")
-            or tags.get("operator")
+    # Project every source geometry in one pass and keep both CRSs together.
+    with stage("project") as counts:
+        geoms_m = to_metres(
+            np.array([geom for _, _, geom in sources], dtype=object)
         )
-        if not name:
-            feature_type = (
-                tags.get("natural")
-                or tags.get("leisure")
-                or tags.get("landuse")
-                or building_type
-                or tags.get("amenity")
-                or "feature"
-            ).lower()
-            if feature_type == "yes":
-                feature_type = "building"
-            feature_type = feature_type.replace("_", " ")
-            name = f"Unnamed {feature_type.title()}"
-
-        if name.startswith("Unnamed ") and A < MIN_AREA_UNNAMED:
-            continue
-        if building_type in EXCLUDE_BUILDINGS and A < MIN_AREA_EXCLUDE:
-            continue
-        if A < MIN_AREA_EXCLUDE and name.startswith("Unnamed "):
-            continue
-        if any(re.search(pattern, name, re.I) for pattern in BLACKLIST):
-            continue
-        if name.startswith("Unnamed "):
-            amenity = (tags.get("amenity") or "").lower()
-            parking = (tags.get("parking") or "").lower()
-            bldg = (tags.get("building") or "").lower()
-            if (
-                amenity == "parking"
-                or bldg == "parking"
-                or parking in {"multi-storey", "underground"}
-            ):
-                ref = (tags.get("ref") or "").strip()
-                m = re.search(
-                    r"(?:^|[^0-9])([Pp]?\s*\d{1,2})(?:[^0-9]|$)", ref
+        areas = shapely.area(geoms_m)
+        counts["geometries"] = len(sources)
+
+    with stage("spatial_classes"):
+        centroids, main_campus, zones = _spatial_classes(
+            np.array([geom for _, _, geom in sources], dtype=object),
+            geoms_m,
+            campus_geom_m,
+        )
+    with stage("build_props") as counts:
+        # Workers only need the id and tags, not the whole element.
+        all_props = _build_all_props(
+            [
+                ({"id": el["id"], "tags": el.get("tags", {})}, float(A), *spatial)
+                for (_, el, _), A, spatial in zip(
+                    sources, areas, zip(centroids, main_campus, zones)
                 )
-                if m:
-                    num = re.sub(r"[^\d]", "", m.group(1))
-                    name = f"Parking Structure {num}"
-                else:
-                    name = "Parking Structure"
-
-        aliases = []
-        for k in ("alt_name", "short_name", "old_name"):
-            if tags.get(k):
-                aliases += [a.strip() for a in tags[k].split(";")]
-        if tags.get("ref"):
-            aliases.append(tags["ref"])
-        aliases = list(
-            {
-                a.strip(): None
-                for a in aliases
-                if a and a.strip().lower() != name.lower()
-            }.keys()
+            ],
+            workers,
         )
-
-        c = geom.centroid
-        centroid = [round(c.x, 6), round(c.y, 6)]
-
-        main_campus = False
-        if campus_geom_m:
-            main_campus = geom_m.intersects(campus_geom_m)
-
-        zone = determine_zone(centroid, main_campus)
-        category = determine_category(
-            {**tags, "name": name, "zone": zone, "id": osm_id}
+        counts.update(
+            elements=len(sources),
+            features=sum(props is not None for props in all_props),
         )
+    built: List[ElementKey] = []
+    records: List[FeatureRecord] = []
+    for (key, _, geom), geom_m, props in zip(sources, geoms_m, all_props):
+        if props is not None:
+            built.append(key)
+            records.append(FeatureRecord(props, geom, geom_m))
 
-        fid = f"{slugify(name)}-{hash_centroid(centroid)}"
-        props = {
-            "id": fid,
-            "name": name,
-            "aliases": aliases,
-            "zone": zone,
-            "category": category,
-            "centroid": centroid,
-            "osm_id": osm_id,
-            "area": round(A, 2),
-            "main_campus": main_campus,
-            "overlap_role": "solo",
-            "updated_at": datetime.now(timezone.utc)
-            .isoformat()
-            .replace("+00:00", "Z"),
-        }
-
-        name_norm = name.strip().lower()
-        if name_norm in {"ucla", "university of california, los angeles"} and (
-            tags.get("amenity") == "university"
-            or tags.get("landuse") == "university"
-        ):
-            props["render"] = False
-
-        if props.get("render") is not False:
-            props["render"] = True
-
-        g_view = simplify_geom_m(geom, SINGLE_TOLERANCE_M)
-        if not g_view:
-            continue
-
-        features.append(
-            {
-                "type": "Feature",
-                "properties": props,
-                "geometry": mapping(g_view),
-            }
+    with stage("simplify") as counts:
+        views_m = shapely.simplify(
+            np.array([r.geom_m for r in records], dtype=object),
+            SINGLE_TOLERANCE_M,
+            preserve_topology=True,
+        )
+        views = to_degrees(views_m)
+        counts["geometries"] = len(records)
+    drawn = [i for i, view in enumerate(views) if not view.is_empty]
+    with stage("label_points") as counts:
+        labels = to_degrees(label_points_m(views_m[drawn], LABEL_TOLERANCE_M))
+        bounds = shapely.bounds(views[drawn])
+        perimeters = shapely.length(
+            np.array([records[i].geom_m for i in drawn], dtype=object)
         )
+        counts["geometries"] = len(drawn)
+    for i, label, bbox, perimeter in zip(
+        drawn, shapely.get_coordinates(labels).tolist(), bounds.tolist(), perimeters
+    ):
+        record = records[i]
+        record.view_m = views_m[i]
+        record.view = views[i]
+        record.props["label"] = [round(c, 6) for c in label]
+        record.props["bbox"] = [round(c, 6) for c in bbox]
+        record.props["perimeter"] = round(float(perimeter), 2)
+        results[built[i]] = record
 
-    deduped = {}
-    removed_dupes = 0
-    for feat in features:
-        centroid = tuple(feat["properties"]["centroid"])
-        existing = deduped.get(centroid)
-        if existing is None:
-            deduped[centroid] = feat
-        else:
-            existing_named = not existing["properties"]["name"].startswith(
-                "Unnamed "
-            )
-            new_named = not feat["properties"]["name"].startswith("Unnamed ")
-            if new_named and not existing_named:
-                deduped[centroid] = feat
-            removed_dupes += 1
+    kept: List[FeatureRecord] = []
+    for key in keys:
+        record = results[key]
+        # A skipped member way keeps its fingerprint when only its relation
+        # changes, so it is not stored: a stored None would hide the way once
+        # the relation releases it.
+        if state is not None and key not in skipped:
+            state.put(key, fingerprints[key], record)
+        if record is not None:
+            # The global passes below edit props in place; keep the stored
+            # per-element result untouched.
+            kept.append(replace(record, props=dict(record.props)))
+    if state is not None:
+        state.commit()
+
+    with stage("dedupe") as counts:
+        deduped: Dict[Any, FeatureRecord] = {}
+        removed_dupes = 0
+        for record in kept:
+            centroid = tuple(record.props["centroid"])
+            existing = deduped.get(centroid)
+            if existing is None:
+                deduped[centroid] = record
+            else:
+                existing_named = not existing.props["name"].startswith("Unnamed ")
+                new_named = not record.props["name"].startswith("Unnamed ")
+                if new_named and not existing_named:
+                    deduped[centroid] = record
+                removed_dupes += 1
+        counts.update(features=len(kept), removed=removed_dupes)
 
     print(f"  Removed {removed_dupes} duplicate feature(s) by centroid")
-    features = list(
-        sorted(
-            deduped.values(),
-            key=lambda feat: feat["properties"]["area"],
-            reverse=True,
-        )
+    records = sorted(
+        deduped.values(),
+        key=lambda record: record.props["area"],
+        reverse=True,
     )
-    renamed = assign_parent_child(features)
+    features = [record.to_feature() for record in records]
+    with stage("parent_child") as counts:
+        renamed = assign_parent_child(
+            features, [record.view_m for record in records]
+        )
+        counts.update(features=len(features), renamed=renamed)
     print(
         f"  Renamed {renamed} unnamed feature(s) contained within a named feature"
     )
+    if lod_tolerances:
+        with stage("lod") as counts:
+            # Coverage simplification depends on neighbouring features, so
+            # unlike the 0.4 m view it runs over the final set every build.
+            sources_m = np.array([record.geom_m for record in records], dtype=object)
+            for tol in lod_tolerances:
+                views = to_degrees(simplify_coverage_m(sources_m, tol))
+                for feature, view in zip(features, views):
+                    feature.setdefault("lods", {})[tol] = mapping(view)
+            counts.update(features=len(features), levels=len(lod_tolerances))
+    with stage("hilbert_order") as counts:
+        # Neighbouring features end up next to each other in the file, which
+        # keeps bbox scans and tiling local and helps the compressors.
+        south, west, north, east = BBOX
+        order = hilbert_order(
+            np.array([f["properties"]["centroid"] for f in features], dtype=float),
+            (west, south, east, north),
+        )
+        features = [features[i] for i in order.tolist()]
+        counts["features"] = len(features)
     print(f"Generated {len(features)} features")
     return features
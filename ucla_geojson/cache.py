@@ -0,0 +1,198 @@
+import gzip
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from .constants import CACHE_MAX_BYTES, CACHE_TTL_S
+
+CACHE_DIR: Path = Path(__file__).resolve().parent.parent / "cache"
+CACHE_DIR.mkdir(exist_ok=True)
+
+_ENTRY_SUFFIX = ".json.gz"
+_META_SUFFIX = ".meta.json"
+
+
+def is_error_remark(remark: Optional[str]) -> bool:
+    """True if an Overpass ``remark`` says the result is incomplete.
+
+    Overpass reports query timeouts and out-of-memory aborts as an HTTP 200
+    whose ``remark`` starts with "runtime error", with whatever elements it
+    had produced so far.
+    """
+    if not remark:
+        return False
+    remark = remark.lower()
+    return "runtime error" in remark or "timed out" in remark
+
+
+def _utc_iso(ts: float) -> str:
+    return (
+        datetime.fromtimestamp(ts, timezone.utc)
+        .isoformat()
+        .replace("+00:00", "Z")
+    )
+
+
+class ResponseCache:
+    """Gzip-compressed Overpass response cache with TTL and LRU eviction.
+
+    Each entry is ``<sha256(url)>.json.gz`` plus a ``.meta.json`` sidecar
+    holding the URL, fetch time, TTL, Overpass ``timestamp_osm_base`` and the
+    last access time used for eviction. ``refresh`` ignores stored entries;
+    ``offline`` never asks for a fetch and accepts expired entries.
+    """
+
+    def __init__(
+        self,
+        directory: Path = CACHE_DIR,
+        ttl: float = CACHE_TTL_S,
+        max_bytes: int = CACHE_MAX_BYTES,
+        refresh: bool = False,
+        offline: bool = False,
+    ) -> None:
+        if refresh and offline:
+            raise ValueError("refresh and offline are mutually exclusive")
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.offline = offline
+
+    def key(self, url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}{_ENTRY_SUFFIX}"
+
+    def meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}{_META_SUFFIX}"
+
+    def _read_meta(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self.meta_path(key).open(encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]) -> None:
+        tmp = self.meta_path(key).with_suffix(".part")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        tmp.replace(self.meta_path(key))
+
+    def info(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the sidecar metadata stored for ``url``, if any."""
+        return self._read_meta(self.key(url))
+
+    def open(self, url: str) -> Optional[IO[str]]:
+        """Return a text stream over a usable entry, or None to fetch.
+
+        Raises RuntimeError in offline mode when there is no entry at all.
+        """
+        key = self.key(url)
+        path = self.entry_path(key)
+        meta = self._read_meta(key)
+        if meta is None or not path.exists():
+            if self.offline:
+                raise RuntimeError(f"No cached response for {url} (offline)")
+            return None
+        if self.refresh:
+            return None
+        if is_error_remark(meta.get("remark")):
+            # Written before such responses were refused; never serve it.
+            if self.offline:
+                raise RuntimeError(
+                    f"Cached response for {url} is incomplete: {meta['remark']}"
+                )
+            return None
+        # An entry expires at its own TTL or the current one, whichever is
+        # shorter, so lowering the TTL takes effect on existing entries.
+        age = time.time() - meta.get("fetched_at", 0)
+        if age > min(meta.get("ttl", self.ttl), self.ttl):
+            if not self.offline:
+                return None
+            print(f"  Using expired cache entry {key[:16]} (offline)")
+        return self.read(url)
+
+    def read(self, url: str) -> IO[str]:
+        """Open the stored entry for ``url`` regardless of its age."""
+        key = self.key(url)
+        meta = self._read_meta(key) or {}
+        meta["last_access"] = time.time()
+        self._write_meta(key, meta)
+        return gzip.open(self.entry_path(key), "rt", encoding="utf-8")
+
+    @contextmanager
+    def store(self, url: str) -> Iterator[Tuple[IO[bytes], Dict[str, Any]]]:
+        """Write a new entry from raw response bytes.
+
+        Yields a binary sink and a dict the caller may fill with response
+        metadata (``timestamp_osm_base``, ``remark``, ...) to be stored in
+        the sidecar. The entry only replaces the
+        previous one if the block finishes without error and ``remark`` does
+        not report an incomplete result; otherwise ValueError is raised.
+        """
+        if self.offline:
+            raise RuntimeError("Cannot store responses in offline mode")
+        key = self.key(url)
+        path = self.entry_path(key)
+        tmp = path.with_suffix(".part")
+        info: Dict[str, Any] = {}
+        try:
+            with tmp.open("wb") as raw, gzip.GzipFile(
+                fileobj=raw, mode="wb", compresslevel=6
+            ) as sink:
+                yield sink, info
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        if is_error_remark(info.get("remark")):
+            tmp.unlink(missing_ok=True)
+            raise ValueError(f"Refusing to cache incomplete response: {info['remark']}")
+        tmp.replace(path)
+        now = time.time()
+        meta = {
+            "url": url,
+            "fetched_at": now,
+            "fetched_at_iso": _utc_iso(now),
+            "ttl": self.ttl,
+            "timestamp_osm_base": None,
+            "size": path.stat().st_size,
+            "last_access": now,
+        }
+        meta.update(info)
+        self._write_meta(key, meta)
+        print(f"  Saved cache entry {key[:16]} ({path.stat().st_size} bytes)")
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used entries until under ``max_bytes``."""
+        entries: List[Tuple[float, int, str]] = []
+        for meta_file in self.directory.glob(f"*{_META_SUFFIX}"):
+            key = meta_file.name[: -len(_META_SUFFIX)]
+            meta = self._read_meta(key)
+            path = self.entry_path(key)
+            if meta is None or not path.exists():
+                meta_file.unlink(missing_ok=True)
+                continue
+            size = path.stat().st_size
+            entries.append((meta.get("last_access", 0), size, key))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.entry_path(key).unlink(missing_ok=True)
+            self.meta_path(key).unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            print(f"  Evicted {evicted} cache entries over the size cap")
+        return evicted
+
+
+__all__ = ["CACHE_DIR", "ResponseCache", "is_error_remark"]
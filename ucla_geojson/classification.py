@@ -1,7 +1,8 @@
 import re
-from typing import Callable, Dict, Iterable, List, Sequence, Set, Tuple
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
-from shapely.geometry import Point
+import numpy as np
 
 from .constants import GREEK_NAME_RE
 
@@ -10,12 +11,24 @@ def _hint_in(name_norm: str, hints: Set[str]) -> bool:
     return any(h in name_norm for h in hints)
 
 
-def _includes(*args):
-    return lambda x: any(arg in x for arg in args)
+class _includes:
+    """Rule target matching values that contain any of ``args``."""
 
+    def __init__(self, *args: str) -> None:
+        self.args = args
 
-def _or(*args):
-    return lambda x: x in args
+    def __call__(self, x: Any) -> bool:
+        return any(arg in x for arg in self.args)
+
+
+class _or:
+    """Rule target matching values equal to any of ``args``."""
+
+    def __init__(self, *args: Any) -> None:
+        self.args = args
+
+    def __call__(self, x: Any) -> bool:
+        return x in self.args
 
 
 CLASSIFICATION = [
@@ -178,49 +191,270 @@ CLASSIFICATION = [
 ]
 
 
+# A half-plane (axis, op, slope, intercept) holds for a centroid (x=lon,
+# y=lat) when ``centroid[axis] op slope * centroid[other axis] + intercept``.
+HalfPlane = Tuple[str, str, float, float]
+
+# (zone, main_campus, half-planes): the first rule whose main_campus flag
+# matches and whose half-planes all hold decides the zone. A rule with no
+# half-planes is the fallback for its side of the campus boundary.
+ZONE_RULES: List[Tuple[str, bool, Tuple[HalfPlane, ...]]] = [
+    ("Southwest Campus", False, (("y", "<=", 0.0, 34.0630),)),
+    (
+        "Southwest Campus",
+        False,
+        (("y", "<=", 0.0, 34.0644), ("x", "<=", 0.0, -118.4482036664417)),
+    ),
+    ("Westwood", False, ()),
+    ("The Hill", True, (("x", "<=", -0.1135, -114.5823),)),
+    ("North Campus", True, (("y", ">=", 0.0, 34.0732),)),
+    ("South Campus", True, (("y", "<=", 0.0, 34.0698),)),
+    ("Center Campus", True, ()),
+]
+
+_OPS: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "<=": np.less_equal,
+    ">=": np.greater_equal,
+    "<": np.less,
+    ">": np.greater,
+}
+
+
+def determine_zones(centroids: np.ndarray, main_campus: np.ndarray) -> List[str]:
+    """Return the campus zone for each (lon, lat) centroid row.
+
+    Evaluates ZONE_RULES over the whole array at once; every comparison is
+    the same float expression the per-feature thresholds used.
+    """
+    centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+    main_campus = np.asarray(main_campus, dtype=bool)
+    axes = {"x": centroids[:, 0], "y": centroids[:, 1]}
+    other = {"x": axes["y"], "y": axes["x"]}
+    zones = np.full(len(centroids), "", dtype=object)
+    open_ = np.ones(len(centroids), dtype=bool)
+    for zone, on_campus, planes in ZONE_RULES:
+        hit = open_ & (main_campus == on_campus)
+        for axis, op, slope, intercept in planes:
+            hit &= _OPS[op](axes[axis], slope * other[axis] + intercept)
+        zones[hit] = zone
+        open_ &= ~hit
+    return zones.tolist()
+
+
 def determine_zone(centroid: Sequence[float], main_campus: bool) -> str:
-    """Return the campus zone for a given centroid.
+    """Return the campus zone for a single centroid."""
+    return determine_zones(np.array([centroid]), np.array([main_campus]))[0]
+
+
+Rule = Tuple[str, Dict[str, Any]]
+
 
-    The previous implementation used a pair of longitude/latitude thresholds
-    to split the campus.  This version uses polygon containment which better
-    captures the irregular campus outline while retaining a threshold-based
-    fallback for outliers.
+class RuleSet:
+    """A rule list like CLASSIFICATION compiled into lookup tables.
+
+    A rule matches when all of its conditions hold, and the first matching
+    rule wins, exactly as walking the list would. Instead of walking it,
+    ``first_match`` gathers the conditions a feature satisfies from:
+
+    - a ``(key, value)`` dict for plain values and ``_or`` targets (which
+      covers the id rules),
+    - one regex per key for all ``_includes`` substrings of that key,
+    - direct calls for any other callable target,
+
+    and returns the lowest rule whose conditions are all satisfied.
     """
 
-    point = Point(centroid)
+    def __init__(self, rules: Sequence[Rule]) -> None:
+        self.rules = list(rules)
+        self.needed: List[int] = []
+        self.owner: List[int] = []
+        self.targets: List[Any] = []
+        self.always: int = len(self.rules)
+        self.exact: Dict[Tuple[str, Any], List[int]] = {}
+        self.substrings: Dict[str, Tuple[re.Pattern, Dict[str, List[int]]]] = {}
+        self.opaque: Dict[str, List[Tuple[int, Callable[[Any], bool]]]] = {}
+
+        words: Dict[str, Dict[str, List[int]]] = {}
+        for index, (_, rule) in enumerate(self.rules):
+            self.needed.append(len(rule))
+            if not rule:
+                self.always = min(self.always, index)
+            for key, target in rule.items():
+                cond = len(self.owner)
+                self.owner.append(index)
+                self.targets.append(target)
+                if isinstance(target, _or):
+                    for value in set(target.args):
+                        self.exact.setdefault((key, value), []).append(cond)
+                elif isinstance(target, _includes):
+                    by_word = words.setdefault(key, {})
+                    for word in set(target.args):
+                        by_word.setdefault(word, []).append(cond)
+                elif callable(target):
+                    self.opaque.setdefault(key, []).append((cond, target))
+                else:
+                    self.exact.setdefault((key, target), []).append(cond)
+
+        for key, by_word in words.items():
+            # Longest first, so at each position the regex reports the
+            # longest word; every shorter word matching there is a prefix of
+            # it and is added through the closure.
+            ordered = sorted(by_word, key=len, reverse=True)
+            pattern = re.compile(
+                "(?=(" + "|".join(re.escape(w) for w in ordered) + "))"
+            )
+            closure = {
+                word: sorted(
+                    {
+                        cond
+                        for other in ordered
+                        if word.startswith(other)
+                        for cond in by_word[other]
+                    }
+                )
+                for word in ordered
+            }
+            self.substrings[key] = (pattern, closure)
+
+    def _satisfied(self, tags: Dict[str, Any]) -> Set[int]:
+        hits: Set[int] = set()
+        for key, value in tags.items():
+            try:
+                conds = self.exact.get((key, value))
+            except TypeError:  # unhashable value
+                conds = None
+            if conds:
+                hits.update(conds)
+        for key, (pattern, closure) in self.substrings.items():
+            value = tags.get(key)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                for m in pattern.finditer(value):
+                    hits.update(closure[m.group(1)])
+            else:
+                # Non-string values go through the callables as before.
+                for conds in closure.values():
+                    hits.update(c for c in conds if self.targets[c](value))
+        for key, conds in self.opaque.items():
+            if key in tags:
+                hits.update(cond for cond, fn in conds if fn(tags[key]))
+        return hits
+
+    def first_match(self, tags: Dict[str, Any]) -> int:
+        """Return the index of the first matching rule, or len(rules)."""
+        counts: Dict[int, int] = {}
+        for cond in self._satisfied(tags):
+            index = self.owner[cond]
+            counts[index] = counts.get(index, 0) + 1
+        best = self.always
+        for index, count in counts.items():
+            if count == self.needed[index] and index < best:
+                best = index
+        return best
+
+    def category(self, tags: Dict[str, Any]) -> Optional[str]:
+        index = self.first_match(tags)
+        return self.rules[index][0] if index < len(self.rules) else None
+
+
+COMPILED_CLASSIFICATION = RuleSet(CLASSIFICATION)
 
-    lat, lon = point.x, point.y
-    if not main_campus:
-        if lon <= 34.0630 or (lon <= 34.0644 and lat <= -118.4482036664417):
-            return "Southwest Campus"
-        return "Westwood"
-    if lat <= -0.1135 * lon - 114.5823:
-        return "The Hill"
-    if lon >= 34.0732:
-        return "North Campus"
-    if lon <= 34.0698:
-        return "South Campus"
-    return "Center Campus"
+
+def _describe(target: Any) -> Any:
+    if isinstance(target, _includes):
+        return {"includes": list(target.args)}
+    if isinstance(target, _or):
+        return {"any_of": list(target.args)}
+    if callable(target):
+        return repr(target)
+    return target
+
+
+class ClassificationStats:
+    """Per-rule hit counts and timing collected by determine_category."""
+
+    def __init__(self, rules: Sequence[Rule] = CLASSIFICATION) -> None:
+        self.rules = list(rules)
+        self.hits = [0] * len(self.rules)
+        self.features = 0
+        self.depth_total = 0
+        self.seconds = 0.0
+
+    def record(self, index: int, seconds: float) -> None:
+        self.features += 1
+        self.seconds += seconds
+        if index < len(self.rules):
+            self.hits[index] += 1
+            # Rules a list walk would have tried, the matching one included.
+            self.depth_total += index + 1
+        else:
+            self.depth_total += len(self.rules)
+
+    def merge(self, other: "ClassificationStats") -> None:
+        self.hits = [a + b for a, b in zip(self.hits, other.hits)]
+        self.features += other.features
+        self.depth_total += other.depth_total
+        self.seconds += other.seconds
+
+    def report(self) -> Dict[str, Any]:
+        rules = [
+            {
+                "index": index,
+                "category": cat,
+                "conditions": {k: _describe(t) for k, t in rule.items()},
+                "hits": hits,
+            }
+            for index, ((cat, rule), hits) in enumerate(zip(self.rules, self.hits))
+        ]
+        return {
+            "features": self.features,
+            "seconds": round(self.seconds, 6),
+            "mean_depth": (
+                round(self.depth_total / self.features, 3) if self.features else 0
+            ),
+            "never_fired": [r["index"] for r in rules if not r["hits"]],
+            "rules": rules,
+        }
+
+
+# None unless enable_stats() was called, so the normal path pays one check.
+_stats: Optional[ClassificationStats] = None
+
+
+def enable_stats() -> ClassificationStats:
+    """Start recording determine_category statistics and return the sink."""
+    global _stats
+    _stats = ClassificationStats()
+    return _stats
+
+
+def disable_stats() -> Optional[ClassificationStats]:
+    """Stop recording and return what was collected."""
+    global _stats
+    stats, _stats = _stats, None
+    return stats
+
+
+def current_stats() -> Optional[ClassificationStats]:
+    return _stats
 
 
 def determine_category(tags: Dict[str, str]) -> str:
     """Return the category for a feature.
 
-    This version organises the category logic into a sequence of rules rather
-    than a long chain of conditionals.  Each rule encapsulates the criteria for
-    identifying a category, making it easier to maintain and extend.
+    Rules are checked in CLASSIFICATION order through the compiled
+    COMPILED_CLASSIFICATION tables; the first full match wins.
     """
-    for cat, rule in CLASSIFICATION:
-        for rule_tag, rule_target in rule.items():
-            if rule_tag not in tags:
-                break
-            if callable(rule_target):
-                if not rule_target(tags[rule_tag]):
-                    break
-            elif tags[rule_tag] != rule_target:
-                break
-        else:
-            if cat == "Unassigned":
-                # raise RuntimeError(f"{name} is unassigned")
-                print(f"Warning: {tags["id"]} is unassigned")
-            return cat
+    if _stats is None:
+        index = COMPILED_CLASSIFICATION.first_match(tags)
+    else:
+        start = perf_counter()
+        index = COMPILED_CLASSIFICATION.first_match(tags)
+        _stats.record(index, perf_counter() - start)
+    rules = COMPILED_CLASSIFICATION.rules
+    cat = rules[index][0] if index < len(rules) else None
+    if cat == "Unassigned":
+        # raise RuntimeError(f"{name} is unassigned")
+        print(f"Warning: {tags["id"]} is unassigned")
+    return cat
@@ -1,5 +1,5 @@
 import pyproj
-from typing import Callable, Set, Tuple
+from typing import Callable, Dict, Set, Tuple
 
 BBOX: Tuple[float, float, float, float] = (
     34.058,
@@ -9,7 +9,35 @@ BBOX: Tuple[float, float, float, float] = (
 )  # (south, west, north, east)
 BBOX_QUERY: str = f"({BBOX[0]},{BBOX[1]},{BBOX[2]},{BBOX[3]})"
 OVERPASS_URL: str = "https://overpass-api.de/api/interpreter"
+CACHE_TTL_S: float = 7 * 24 * 3600  # seconds before a cached response is refetched
+CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # LRU-evict cached responses past this
+FETCH_CONCURRENCY: int = 2  # simultaneous Overpass requests
+FETCH_TIMEOUT_S: float = 180  # socket timeout per Overpass request
+FETCH_RETRIES: int = 4  # retries after the first attempt
+FETCH_BACKOFF_S: float = 2.0  # base of the exponential retry backoff
+FETCH_MAX_BACKOFF_S: float = 120.0  # cap on any single retry wait
+TILE_MAX_DEPTH: int = 5  # quadtree splits allowed below BBOX in tiled mode
+TILE_MAX_BYTES: int = 64 * 1024 * 1024  # split tiles whose response is larger
+TILE_RETRIES: int = 1  # retries per tile before splitting it instead
+BUILD_WORKERS: int = 0  # feature build processes; 0 = one per CPU
+PARALLEL_MIN_SOURCES: int = 4000  # build serially below this many elements
 SINGLE_TOLERANCE_M: float = 0.4  # meters detail for BOTH draw and hit
+LOD_TOLERANCES_M: Tuple[float, ...] = (2.0,)  # MapView draws it below zoom 16
+LABEL_TOLERANCE_M: float = 0.5  # pole-of-inaccessibility search precision
+COORD_PRECISION: int = 6  # decimal places kept by compact output (~0.1 m)
+PATCH_HISTORY: int = 20  # builds kept in the public/patches version chain
+TILE_MIN_ZOOM: int = 15  # vector tile pyramid zooms (MapView minZoom)
+TILE_MAX_ZOOM: int = 17  # clients overzoom past this
+TILE_EXTENT: int = 4096  # tile grid units per side
+TILE_BUFFER: int = 64  # grid units drawn past each tile edge
+TILE_PROPERTIES: Dict[str, str] = {  # feature properties kept in tiles, by type
+    "id": "String",
+    "name": "String",
+    "category": "String",
+    "zone": "String",
+    "area": "Number",
+    "render": "Boolean",
+}
 EXCLUDE_BUILDINGS: Set[str] = {"hut", "shed", "garage", "kiosk", "tent", "container"}
 MIN_AREA_UNNAMED: int = 80  # m²
 MIN_AREA_EXCLUDE: int = 120  # m²
@@ -0,0 +1,107 @@
+import json
+from typing import Any, Dict, List, Optional
+
+PATCH_DIR: str = "public/patches"
+CHAIN_PATH: str = f"{PATCH_DIR}/versions.json"
+
+
+def _plain(value: Any) -> Any:
+    # Tuples from shapely's mapping() compare unequal to the lists JSON loads.
+    return json.loads(json.dumps(value))
+
+
+def diff_features(
+    old: List[Dict[str, Any]], new: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Describe how to turn ``old`` into ``new``, matching features by id.
+
+    Returns ``added`` (whole features), ``removed`` (ids) and ``changed``:
+    per id, only the properties whose value changed, the names of removed
+    properties under ``unset`` and the geometry if it moved. ``at`` gives the
+    index of each added feature in the new list, so inserting them in turn
+    after the removals restores the order. Only when the kept features
+    themselves moved does ``order`` list every id.
+    """
+    old_by_id = {f["properties"]["id"]: f for f in old}
+    new_ids = [f["properties"]["id"] for f in new]
+    added = []
+    changed: Dict[str, Dict[str, Any]] = {}
+    for f in new:
+        fid = f["properties"]["id"]
+        prev = old_by_id.get(fid)
+        if prev is None:
+            added.append(f)
+            continue
+        if prev["properties"].get("hash") and (
+            prev["properties"].get("hash") == f["properties"].get("hash")
+        ):
+            continue
+        props = _plain(f["properties"])
+        edit: Dict[str, Any] = {}
+        props_changed = {
+            k: v for k, v in props.items() if prev["properties"].get(k, None) != v
+        }
+        if props_changed:
+            edit["properties"] = props_changed
+        unset = [k for k in prev["properties"] if k not in props]
+        if unset:
+            edit["unset"] = unset
+        geometry = _plain(f["geometry"])
+        if geometry != prev["geometry"]:
+            edit["geometry"] = geometry
+        if edit:
+            changed[fid] = edit
+    kept = set(new_ids)
+    removed = [fid for fid in old_by_id if fid not in kept]
+    patch: Dict[str, Any] = {
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+    }
+    added_ids = {f["properties"]["id"] for f in added}
+    if added:
+        patch["at"] = [i for i, fid in enumerate(new_ids) if fid in added_ids]
+    applied = [f["properties"]["id"] for f in old if f["properties"]["id"] in kept]
+    if applied != [fid for fid in new_ids if fid not in added_ids]:
+        patch["order"] = new_ids
+    return patch
+
+
+def load_chain(path: str = CHAIN_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"latest": None, "versions": []}
+
+
+def extend_chain(
+    chain: Dict[str, Any],
+    parent: Optional[str],
+    version: str,
+    patch: Optional[str],
+    size: int,
+    history: int,
+) -> List[str]:
+    """Append ``version`` to ``chain``; return patch files that fell off it.
+
+    Each entry names the version, the version it was diffed against and the
+    patch file (relative to public/) that upgrades ``parent`` to it. Only the
+    newest ``history`` entries are kept. Patch names repeat when a history
+    revisits the same pair of versions, so a dropped entry's file is only
+    returned if no kept entry still points at it.
+    """
+    versions = chain.get("versions", [])
+    versions.append(
+        {"version": version, "parent": parent, "patch": patch, "bytes": size}
+    )
+    dropped = versions[:-history] if len(versions) > history else []
+    chain["versions"] = versions[-history:]
+    chain["latest"] = version
+    kept = {v.get("patch") for v in chain["versions"]}
+    return sorted(
+        {v["patch"] for v in dropped if v.get("patch") and v["patch"] not in kept}
+    )
+
+
+__all__ = ["diff_features", "extend_chain", "load_chain"]
@@ -0,0 +1,345 @@
+import bz2
+import gzip
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import shapely
+
+from .builder import CAMPUS_WAY_ID
+from .constants import BBOX
+from .fetcher import Bbox, _campus_lines, _greek_lines, _ucla_related_lines
+from .geometry import NodeStore, index_nodes
+
+Element = Dict[str, Any]
+Filter = Callable[[Dict[str, str]], bool]
+
+_STATEMENT_RE = re.compile(r"^(way|relation)((?:\[[^\]]*\])+)")
+_FILTER_RE = re.compile(
+    r'\[(!)?"?([^"\]=~!]+)"?(?:(=|~)"((?:[^"\\]|\\.)*)"(,i)?)?\]'
+)
+
+
+def _compile_filter(negate: str, key: str, op: str, value: str, icase: str) -> Filter:
+    if negate:
+        return lambda tags: key not in tags
+    if not op:
+        return lambda tags: key in tags
+    if op == "=":
+        return lambda tags: tags.get(key) == value
+    pattern = re.compile(value, re.I if icase else 0)
+    return lambda tags: key in tags and pattern.search(tags[key]) is not None
+
+
+def _compile_statements(lines: List[str]) -> Dict[str, List[List[Filter]]]:
+    """Turn Overpass tag-filter statements into per-type predicate lists.
+
+    Only the tag filters are kept; read_extract applies the ``(area.ucla)``
+    and bbox locations separately.
+    """
+    compiled: Dict[str, List[List[Filter]]] = {"way": [], "relation": []}
+    for line in lines:
+        m = _STATEMENT_RE.match(line)
+        if not m:
+            raise ValueError(f"Unsupported Overpass statement: {line}")
+        filters = [_compile_filter(*f) for f in _FILTER_RE.findall(m.group(2))]
+        compiled[m.group(1)].append(filters)
+    return compiled
+
+
+def _query_filters() -> Tuple[
+    Dict[str, List[List[Filter]]], Dict[str, List[List[Filter]]]
+]:
+    """Return the ``(area.ucla)`` statements and the bbox statements."""
+    return (
+        _compile_statements(_campus_lines()),
+        _compile_statements(_ucla_related_lines() + _greek_lines()),
+    )
+
+
+def _matches(statements: List[List[Filter]], tags: Dict[str, str]) -> bool:
+    return bool(tags) and any(all(f(tags) for f in s) for s in statements)
+
+
+def _open(path: Path) -> IO[bytes]:
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rb")
+    return path.open("rb")
+
+
+class _Callbacks:
+    def __init__(
+        self,
+        node: Optional[Callable[[int, float, float], None]] = None,
+        way: Optional[Callable[[Element], None]] = None,
+        relation: Optional[Callable[[Element], None]] = None,
+    ) -> None:
+        self.node = node
+        self.way = way
+        self.relation = relation
+
+
+def _scan_xml(path: Path, cb: _Callbacks) -> None:
+    with _open(path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag == "node":
+                if cb.node:
+                    cb.node(
+                        int(elem.get("id")),
+                        float(elem.get("lon")),
+                        float(elem.get("lat")),
+                    )
+            elif elem.tag == "way" and cb.way:
+                el: Element = {"type": "way", "id": int(elem.get("id"))}
+                el["nodes"] = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                if tags:
+                    el["tags"] = tags
+                cb.way(el)
+            elif elem.tag == "relation" and cb.relation:
+                el = {"type": "relation", "id": int(elem.get("id"))}
+                el["members"] = [
+                    {
+                        "type": m.get("type"),
+                        "ref": int(m.get("ref")),
+                        "role": m.get("role", ""),
+                    }
+                    for m in elem.iter("member")
+                ]
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                if tags:
+                    el["tags"] = tags
+                cb.relation(el)
+            root.clear()
+
+
+def _scan_pbf(path: Path, cb: _Callbacks) -> None:
+    try:
+        import osmium
+    except ImportError as e:
+        raise RuntimeError(
+            "Reading .osm.pbf extracts needs pyosmium (pip install osmium); "
+            "convert to .osm XML or install it"
+        ) from e
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n: Any) -> None:
+            if cb.node and n.location.valid():
+                cb.node(n.id, n.location.lon, n.location.lat)
+
+        def way(self, w: Any) -> None:
+            if cb.way:
+                el: Element = {
+                    "type": "way",
+                    "id": w.id,
+                    "nodes": [nd.ref for nd in w.nodes],
+                }
+                if len(w.tags):
+                    el["tags"] = {t.k: t.v for t in w.tags}
+                cb.way(el)
+
+        def relation(self, r: Any) -> None:
+            if cb.relation:
+                types = {"n": "node", "w": "way", "r": "relation"}
+                el: Element = {
+                    "type": "relation",
+                    "id": r.id,
+                    "members": [
+                        {"type": types[m.type], "ref": m.ref, "role": m.role}
+                        for m in r.members
+                    ],
+                }
+                if len(r.tags):
+                    el["tags"] = {t.k: t.v for t in r.tags}
+                cb.relation(el)
+
+    Handler().apply_file(str(path), locations=False)
+
+
+def _scan(path: Path, cb: _Callbacks) -> None:
+    if path.name.endswith(".pbf"):
+        _scan_pbf(path, cb)
+    else:
+        _scan_xml(path, cb)
+
+
+def read_extract(path: Path, bbox: Bbox = BBOX) -> Iterator[Element]:
+    """Yield Overpass-shaped elements for ``bbox`` from a local OSM extract.
+
+    Applies the same tag filters as the Overpass queries. "Inside the bbox"
+    is read as "has at least one node inside ``bbox``" and ``(area.ucla)`` as
+    "has at least one node inside the campus way CAMPUS_WAY_ID"; without that
+    way in the extract the campus statements match nothing, as on Overpass.
+    Pass one keeps the nodes inside the bbox and the matching ways and
+    relations.
+    Pass two resolves member ways of matching relations and nodes outside the
+    bbox; a third pass runs only if those member ways reach further out.
+    Supports .osm (optionally .gz/.bz2) and, with pyosmium, .osm.pbf.
+    """
+    path = Path(path)
+    south, west, north, east = bbox
+    campus_filters, bbox_filters = _query_filters()
+
+    ids: array = array("q")
+    lons: array = array("d")
+    lats: array = array("d")
+    inside: List[NodeStore] = []
+
+    def in_bbox() -> NodeStore:
+        # Extracts list all nodes before ways, so the index is final by the
+        # time the first way arrives.
+        if not inside:
+            inside.append(index_nodes(ids, lons, lats))
+        return inside[0]
+
+    def keep_node(nid: int, lon: float, lat: float) -> None:
+        if south <= lat <= north and west <= lon <= east:
+            ids.append(nid)
+            lons.append(lon)
+            lats.append(lat)
+
+    ways: Dict[int, Element] = {}
+    rels: Dict[int, Element] = {}
+    # Elements matched only by (area.ucla) statements; checked against the
+    # campus polygon once its nodes are known.
+    campus_only: Set[Tuple[str, int]] = set()
+
+    def keep_way(el: Element) -> None:
+        tags = el.get("tags", {})
+        if el["id"] == CAMPUS_WAY_ID:
+            ways[el["id"]] = el
+            return
+        near = _matches(bbox_filters["way"], tags)
+        if near or _matches(campus_filters["way"], tags):
+            _, found = in_bbox().lookup(np.asarray(el["nodes"], dtype=np.int64))
+            if found.any():
+                ways[el["id"]] = el
+                if not near:
+                    campus_only.add(("way", el["id"]))
+
+    def keep_relation(el: Element) -> None:
+        tags = el.get("tags", {})
+        near = _matches(bbox_filters["relation"], tags)
+        if near or _matches(campus_filters["relation"], tags):
+            rels[el["id"]] = el
+            if not near:
+                campus_only.add(("relation", el["id"]))
+
+    print(f"Reading extract {path.name} (pass 1)...")
+    _scan(path, _Callbacks(keep_node, keep_way, keep_relation))
+    store = in_bbox()
+
+    members = {
+        m["ref"]
+        for rel in rels.values()
+        for m in rel["members"]
+        if m["type"] == "way"
+    }
+    extra: Dict[int, Element] = {}
+    outside: Dict[int, Tuple[float, float]] = {}
+
+    def missing_nodes(way_list: List[Element]) -> Set[int]:
+        refs = np.fromiter(
+            (n for w in way_list for n in w["nodes"]), dtype=np.int64
+        )
+        _, found = store.lookup(refs)
+        return set(refs[~found].tolist()) - outside.keys()
+
+    wanted_nodes = missing_nodes(list(ways.values()))
+
+    def collect_node(nid: int, lon: float, lat: float) -> None:
+        if nid in wanted_nodes:
+            outside[nid] = (lon, lat)
+
+    def collect_way(el: Element) -> None:
+        if el["id"] in members and el["id"] not in ways:
+            extra[el["id"]] = el
+
+    print(f"Reading extract {path.name} (pass 2)...")
+    _scan(path, _Callbacks(collect_node, collect_way))
+    wanted_nodes = missing_nodes(list(extra.values()))
+    if wanted_nodes:
+        print(f"Reading extract {path.name} (pass 3)...")
+        _scan(path, _Callbacks(collect_node))
+
+    all_ways = {**ways, **extra}
+
+    def node_coords(way: Element) -> np.ndarray:
+        refs = np.asarray(way["nodes"], dtype=np.int64)
+        coords, found = store.lookup(refs)
+        coords = coords.copy()
+        for i in np.flatnonzero(~found).tolist():
+            coords[i] = outside.get(int(refs[i]), (np.nan, np.nan))
+        return coords[~np.isnan(coords).any(axis=1)]
+
+    campus_way = ways.get(CAMPUS_WAY_ID)
+    campus = None
+    if campus_way is not None:
+        ring = node_coords(campus_way)
+        if len(ring) >= 3:
+            campus = shapely.make_valid(shapely.Polygon(ring))
+            shapely.prepare(campus)
+    if campus is None:
+        print(f"  Campus way {CAMPUS_WAY_ID} not in extract; skipping area filters")
+
+    def in_campus(way: Element) -> bool:
+        if campus is None:
+            return False
+        coords = node_coords(way)
+        return bool(shapely.contains_xy(campus, coords[:, 0], coords[:, 1]).any())
+
+    for kind, eid in campus_only:
+        if kind == "way" and not in_campus(ways[eid]):
+            del ways[eid]
+
+    def member_ways(rel: Element) -> Iterator[Element]:
+        for m in rel["members"]:
+            way = all_ways.get(m["ref"]) if m["type"] == "way" else None
+            if way is not None:
+                yield way
+
+    def touches_bbox(rel: Element) -> bool:
+        for way in member_ways(rel):
+            _, found = store.lookup(np.asarray(way["nodes"], dtype=np.int64))
+            if found.any():
+                return True
+        return False
+
+    def keep(rid: int) -> bool:
+        rel = rels[rid]
+        if ("relation", rid) in campus_only:
+            return any(in_campus(way) for way in member_ways(rel))
+        return touches_bbox(rel)
+
+    kept_rels = [rels[rid] for rid in sorted(rels) if keep(rid)]
+    used_members = {
+        m["ref"] for rel in kept_rels for m in rel["members"] if m["type"] == "way"
+    }
+    out_ways = [
+        all_ways[wid]
+        for wid in sorted(all_ways)
+        if wid in ways or wid in used_members
+    ]
+    print(
+        f"Extracted {len(out_ways)} ways, {len(kept_rels)} relations, "
+        f"{len(store.ids) + len(outside)} nodes"
+    )
+
+    yield from out_ways
+    yield from kept_rels
+    for nid, (lon, lat) in zip(store.ids.tolist(), store.coords.tolist()):
+        yield {"type": "node", "id": nid, "lat": lat, "lon": lon}
+    for nid, (lon, lat) in sorted(outside.items()):
+        yield {"type": "node", "id": nid, "lat": lat, "lon": lon}
+
+
+__all__ = ["read_extract"]
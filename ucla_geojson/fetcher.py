@@ -1,16 +1,20 @@
-import hashlib
 import json
-import multiprocessing
-import urllib.parse
-import urllib.request
-from pathlib import Path
-from typing import Any, Dict, Iterable, List, Tuple
+import time
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from .constants import BBOX_QUERY, GREEK_NAME_RE, OVERPASS_URL
-from .utils import shorten
+from .cache import ResponseCache, is_error_remark
+from .constants import (
+    BBOX,
+    BBOX_QUERY,
+    GREEK_NAME_RE,
+    TILE_MAX_BYTES,
+    TILE_MAX_DEPTH,
+    TILE_RETRIES,
+)
+from .metrics import record, stage
+from .overpass import OverpassClient
 
-CACHE_DIR: Path = Path(__file__).resolve().parent.parent / "cache"
-CACHE_DIR.mkdir(exist_ok=True)
+Bbox = Tuple[float, float, float, float]  # (south, west, north, east)
 
 
 BASE_LINES: List[str] = [
@@ -28,7 +32,7 @@ def _tag_lines(tags: Iterable[str], location: str) -> List[str]:
     return lines
 
 
-def _campus_lines() -> List[str]:
+def _campus_lines(clip: str = "") -> List[str]:
     tags = [
         '["building"]',
         '["shop"]',
@@ -38,10 +42,10 @@ def _campus_lines() -> List[str]:
         '["landuse"~"^(grass|recreation_ground|forest|meadow|shrubland)$"]',
         '["natural"~"^(scrub|shrub|shrubland|wood|grassland)$"]',
     ]
-    return _tag_lines(tags, "(area.ucla)")
+    return _tag_lines(tags, f"(area.ucla){clip}")
 
 
-def _ucla_related_lines() -> List[str]:
+def _ucla_related_lines(bbox_query: str = BBOX_QUERY) -> List[str]:
     tags = [
         '["building"]',
         '["shop"]',
@@ -56,22 +60,22 @@ def _ucla_related_lines() -> List[str]:
         for tag in tags:
             for attr in ("name", "operator"):
                 lines.append(
-                    f"{element}{tag}[\"{attr}\"~\"UCLA\",i]{BBOX_QUERY};"
+                    f"{element}{tag}[\"{attr}\"~\"UCLA\",i]{bbox_query};"
                 )
     return lines
 
 
-def _greek_lines() -> List[str]:
+def _greek_lines(bbox_query: str = BBOX_QUERY) -> List[str]:
     lines: List[str] = []
     values = ["fraternity", "sorority"]
     for element in ("way", "relation"):
         for val in values:
-            lines.append(f"{element}[\"amenity\"=\"{val}\"]{BBOX_QUERY};")
-            lines.append(f"{element}[\"building\"=\"{val}\"]{BBOX_QUERY};")
+            lines.append(f"{element}[\"amenity\"=\"{val}\"]{bbox_query};")
+            lines.append(f"{element}[\"building\"=\"{val}\"]{bbox_query};")
     for element in ("way", "relation"):
         for attr in ("name", "operator"):
             lines.append(
-                f"{element}[\"building\"][\"{attr}\"~\"{GREEK_NAME_RE}\",i]{BBOX_QUERY};"
+                f"{element}[\"building\"][\"{attr}\"~\"{GREEK_NAME_RE}\",i]{bbox_query};"
             )
     return lines
 
@@ -80,12 +84,34 @@ def _wrap(lines: Iterable[str], name: str) -> List[str]:
     return ["("] + list(lines) + [f")->.{name};"]
 
 
-def _build_query() -> Tuple[str, Dict[str, str]]:
-    sections = {
-        "campus": _campus_lines(),
-        "ucla_related": _ucla_related_lines(),
-        "greek": _greek_lines(),
-    }
+def _bbox_query(bbox: Bbox) -> str:
+    return "({:.6f},{:.6f},{:.6f},{:.6f})".format(*bbox)
+
+
+def _build_query(
+    tile: Optional[Bbox] = None, geom: bool = False
+) -> Tuple[str, Dict[str, str]]:
+    """Return the combined query and the per-section split queries.
+
+    With ``tile`` every section, including the campus area, is additionally
+    clipped to that (south, west, north, east) box. With ``geom`` the queries
+    end in ``out geom;`` so ways and relation members carry their
+    coordinates inline and no separate nodes are returned.
+    """
+    out = "out geom;" if geom else "out body; >; out skel qt;"
+    if tile is None:
+        sections = {
+            "campus": _campus_lines(),
+            "ucla_related": _ucla_related_lines(),
+            "greek": _greek_lines(),
+        }
+    else:
+        tile_query = _bbox_query(tile)
+        sections = {
+            "campus": _campus_lines(tile_query),
+            "ucla_related": _ucla_related_lines(tile_query),
+            "greek": _greek_lines(tile_query),
+        }
     body: List[str] = []
     for name, lines in sections.items():
         body.extend(_wrap(lines, name))
@@ -94,7 +120,7 @@ def _build_query() -> Tuple[str, Dict[str, str]]:
         + body
         + [
             "(.campus; .ucla_related; .greek; way(807458549););",
-            "out body; >; out skel qt;",
+            out,
         ]
     )
     single = "\n".join(final_lines)
@@ -105,50 +131,305 @@ def _build_query() -> Tuple[str, Dict[str, str]]:
         q_lines = (
             BASE_LINES
             + _wrap(lines, name)
-            + [tail, "out body; >; out skel qt;"]
+            + [tail, out]
         )
         split_queries[name] = "\n".join(q_lines)
 
     return single, split_queries
 
 
-def _build_url(query: str) -> str:
-    return f"{OVERPASS_URL}?{urllib.parse.urlencode({'data': query})}"
+def _load(url: str, cache: ResponseCache) -> Dict[str, Any]:
+    with stage("load_response") as counts:
+        with cache.read(url) as f:
+            data = json.load(f)
+        counts.update(key=cache.key(url)[:16], elements=len(data.get("elements", [])))
+    print(f"  Loaded {len(data.get('elements', []))} elements")
+    return data
+
+
+class _JSONStream:
+    """Incremental reader over a text stream holding one JSON document."""
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, stream: IO[str]) -> None:
+        self.stream = stream
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"Expected {ch!r} in JSON stream at {self.pos}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off by the buffer edge still decodes ("0." -> 0),
+            # so make sure something that cannot continue it follows.
+            if (
+                isinstance(obj, (int, float))
+                and (end == len(self.buf) or self.buf[end] in "0123456789.eE+-")
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_elements(
+    stream: IO[str], meta: Optional[Dict[str, Any]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Yield the ``elements`` of an Overpass JSON response one at a time.
+
+    Only one element is decoded at a time, so memory does not grow with the
+    response size. Every other top-level key (``osm3s``, ``remark``, ...) is
+    stored in ``meta`` as it is reached.
+    """
+    reader = _JSONStream(stream)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "elements":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.peek() == "]":
+                        reader.pos += 1
+                        break
+                    reader.expect(",")
+        else:
+            value = reader.value()
+            if meta is not None:
+                meta[key] = value
+        if reader.peek() == "}":
+            return
+        reader.expect(",")
+
+
+def _stream(url: str, cache: ResponseCache) -> Iterator[Dict[str, Any]]:
+    count = 0
+    # Only the time spent parsing counts, not the consumer's between yields.
+    busy = 0.0
+    with cache.read(url) as f:
+        elements = iter_elements(f)
+        while True:
+            start = time.perf_counter()
+            el = next(elements, None)
+            busy += time.perf_counter() - start
+            if el is None:
+                break
+            count += 1
+            yield el
+    record("stream_response", busy, key=cache.key(url)[:16], elements=count)
+    print(f"  Streamed {count} elements")
+
+
+def _record_fetches(
+    names: List[str],
+    urls: List[str],
+    cache: ResponseCache,
+    timings: Dict[str, Dict[str, Any]],
+) -> None:
+    """Record one ``fetch_<name>`` stage per query; cache hits take no time."""
+    for name, url in zip(names, urls):
+        timing = timings.get(url)
+        if timing is None:
+            info = cache.info(url) or {}
+            record(f"fetch_{name}", 0.0, cached=True, bytes=info.get("bytes"))
+        else:
+            counts = {k: v for k, v in timing.items() if k != "wall_s"}
+            record(f"fetch_{name}", timing["wall_s"], cached=False, **counts)
 
 
-def _fetch(query: str) -> Dict[str, Any]:
-    url = _build_url(query)
-    url_hash = hashlib.sha256(url.encode()).hexdigest()[:16]
-    cache_file = CACHE_DIR / f"{url_hash}.json"
-    cache_file_relative = cache_file.relative_to(CACHE_DIR.parent)
+def _quadrants(tile: Bbox) -> List[Bbox]:
+    south, west, north, east = tile
+    mid_lat = (south + north) / 2
+    mid_lon = (west + east) / 2
+    return [
+        (south, west, mid_lat, mid_lon),
+        (south, mid_lon, mid_lat, east),
+        (mid_lat, west, north, mid_lon),
+        (mid_lat, mid_lon, north, east),
+    ]
+
+
+def _tile_failure(
+    url: str, cache: ResponseCache, errors: Dict[str, Exception]
+) -> Optional[str]:
+    """Return why a tile response is unusable, or None if it is fine."""
+    if url in errors:
+        return str(errors[url])
+    info = cache.info(url) or {}
+    if is_error_remark(info.get("remark")):
+        return info["remark"]
+    if info.get("bytes", 0) > TILE_MAX_BYTES:
+        return f"{info['bytes']} bytes exceeds the {TILE_MAX_BYTES} byte tile cap"
+    return None
+
+
+def _prefetch_tiles(
+    cache: ResponseCache,
+    client: OverpassClient,
+    bbox: Bbox = BBOX,
+    geom: bool = False,
+) -> List[str]:
+    """Fetch ``bbox`` as a quadtree of tiles, splitting tiles that fail.
+
+    Each level is fetched concurrently. A tile that times out, hits a
+    runtime error or returns more than TILE_MAX_BYTES is replaced by its four
+    quadrants, down to TILE_MAX_DEPTH. Every query recurses down (or uses
+    ``out geom``), so ways crossing a tile edge still come back whole. Returns the
+    URLs of the usable tiles in quadtree order.
+    """
+    level: List[Tuple[Tuple[int, ...], Bbox]] = [((), bbox)]
+    done: List[Tuple[Tuple[int, ...], str]] = []
+    while level:
+        queries = [_build_query(tile, geom)[0] for _, tile in level]
+        errors: Dict[str, Exception] = {}
+        timings: Dict[str, Dict[str, Any]] = {}
+        urls = client.prefetch(
+            queries, cache, errors, retries=TILE_RETRIES, timings=timings
+        )
+        _record_fetches(
+            ["tile" + "".join(map(str, path)) for path, _ in level],
+            urls,
+            cache,
+            timings,
+        )
+        next_level = []
+        for (path, tile), url in zip(level, urls):
+            reason = _tile_failure(url, cache, errors)
+            if reason is None:
+                done.append((path, url))
+                continue
+            if len(path) >= TILE_MAX_DEPTH:
+                raise RuntimeError(
+                    f"Tile {_bbox_query(tile)} still failing at depth "
+                    f"{len(path)}: {reason}"
+                )
+            print(f"  Splitting tile {_bbox_query(tile)}: {reason}")
+            next_level.extend(
+                (path + (i,), quad) for i, quad in enumerate(_quadrants(tile))
+            )
+        level = next_level
+    print(f"  Fetched {len(done)} tile(s)")
+    return [url for _, url in sorted(done)]
 
-    if cache_file.exists():
-        print(f"  Using cache at {cache_file_relative}")
-        with cache_file.open() as resp:
-            data = json.load(resp)
+
+def _prefetch(
+    split: bool,
+    tiled: bool,
+    cache: ResponseCache,
+    client: OverpassClient,
+    geom: bool = False,
+) -> List[str]:
+    if tiled:
+        return _prefetch_tiles(cache, client, geom=geom)
+    single_query, split_queries = _build_query(geom=geom)
+    if split:
+        names, queries = list(split_queries), list(split_queries.values())
     else:
-        print(f"  Fetching {shorten(url)} -> {url_hash} hash")
-        with urllib.request.urlopen(url) as resp:
-            data = json.load(resp)
-        with cache_file.open("w") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"  Saved cache to {cache_file}")
-
-    print(f"  Fetched {len(data.get('elements', []))} elements")
-    return data
+        names, queries = ["combined"], [single_query]
+    timings: Dict[str, Dict[str, Any]] = {}
+    urls = client.prefetch(queries, cache, timings=timings)
+    _record_fetches(names, urls, cache, timings)
+    return urls
+
+
+def iter_osm_elements(
+    split: bool = True,
+    cache: Optional[ResponseCache] = None,
+    client: Optional[OverpassClient] = None,
+    tiled: bool = False,
+    geom: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """Stream deduplicated elements from the Overpass queries.
+
+    Responses are first downloaded concurrently into the cache; elements are
+    then parsed one at a time from the cache files, in the same order
+    ``fetch_osm_data`` would combine them.
+    """
+    cache = cache or ResponseCache()
+    client = client or OverpassClient()
+    seen = set()
+    with stage("prefetch") as counts:
+        urls = _prefetch(split, tiled, cache, client, geom)
+        counts["responses"] = len(urls)
+    for url in urls:
+        for el in _stream(url, cache):
+            key = (el.get("type"), el.get("id"))
+            if key not in seen:
+                seen.add(key)
+                yield el
+
 
+def fetch_osm_data(
+    split: bool = True,
+    stream: bool = False,
+    cache: Optional[ResponseCache] = None,
+    client: Optional[OverpassClient] = None,
+    tiled: bool = False,
+    geom: bool = False,
+) -> Dict[str, Any]:
+    """Return Overpass data as ``{"elements": [...]}``.
 
-def fetch_osm_data(split: bool = True) -> Dict[str, Any]:
-    single_query, split_queries = _build_query()
-    if not split:
-        return _fetch(single_query)
+    With ``stream=True`` the ``elements`` value is a one-shot iterator from
+    :func:`iter_osm_elements` and nothing is fetched until it is consumed.
+    With ``tiled=True`` the bounding box is fetched as an adaptive quadtree
+    of tiles instead of the split queries. With ``geom=True`` the responses
+    use ``out geom`` and contain no node elements.
+    """
+    cache = cache or ResponseCache()
+    client = client or OverpassClient()
+    if stream:
+        return {
+            "elements": iter_osm_elements(split, cache, client, tiled, geom)
+        }
+    with stage("prefetch") as counts:
+        urls = _prefetch(split, tiled, cache, client, geom)
+        counts["responses"] = len(urls)
+    if len(urls) == 1:
+        return _load(urls[0], cache)
 
-    with multiprocessing.Pool() as pool:
-        results = pool.map(_fetch, split_queries.values())
     combined: Dict[str, object] = {"elements": []}
     seen = set()
-    for data in results:
-        for el in data.get("elements", []):
+    for url in urls:
+        for el in _load(url, cache).get("elements", []):
             key = (el.get("type"), el.get("id"))
             if key not in seen:
                 combined["elements"].append(el)
@@ -157,4 +438,4 @@ def fetch_osm_data(split: bool = True) -> Dict[str, Any]:
     return combined
 
 
-__all__ = ["fetch_osm_data"]
+__all__ = ["fetch_osm_data", "iter_elements", "iter_osm_elements"]
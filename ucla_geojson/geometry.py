@@ -1,10 +1,212 @@
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+from array import array
+from itertools import chain
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
-from shapely.geometry import LinearRing, LineString, MultiPolygon, Polygon
+import numpy as np
+import shapely
+from shapely.geometry import LineString, MultiPolygon, Polygon
 from shapely.geometry.base import BaseGeometry
-from shapely.ops import linemerge, polygonize, transform, unary_union
+from shapely.ops import linemerge, polygonize, unary_union
 
 from .constants import _TO_DEG, _TO_M
+from .metrics import stage
+
+GeometryLike = Union[BaseGeometry, np.ndarray]
+ElementKey = Tuple[str, int]
+
+
+class NodeStore(NamedTuple):
+    """Columnar node index: sorted ids with matching lon/lat rows."""
+
+    ids: np.ndarray  # int64, sorted
+    coords: np.ndarray  # float64, shape (n, 2) as (lon, lat)
+
+    def lookup(self, refs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the coordinates of each ref and whether it was found."""
+        if not len(self.ids):
+            return np.zeros((len(refs), 2)), np.zeros(len(refs), dtype=bool)
+        pos = np.searchsorted(self.ids, refs)
+        np.minimum(pos, len(self.ids) - 1, out=pos)
+        return self.coords[pos], self.ids[pos] == refs
+
+
+def index_nodes(
+    ids: Sequence[int], lons: Sequence[float], lats: Sequence[float]
+) -> NodeStore:
+    ids_arr = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids_arr, kind="stable")
+    coords = np.column_stack(
+        (np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+    )
+    return NodeStore(ids_arr[order], coords[order].reshape(-1, 2))
+
+
+def way_coords(
+    ways: Dict[int, Dict[str, Any]], store: NodeStore
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return per-way coordinate counts and the concatenated coordinates.
+
+    Ways fetched with ``out geom`` carry their coordinates inline and are
+    read directly; the rest are resolved through ``store``. ``found`` marks
+    the coordinates that could be resolved.
+    """
+    n = len(ways)
+    inline = np.fromiter(
+        ("geometry" in way for way in ways.values()), bool, count=n
+    )
+    counts = np.fromiter(
+        (
+            len(way["geometry"] if "geometry" in way else way.get("nodes", []))
+            for way in ways.values()
+        ),
+        np.int64,
+        count=n,
+    )
+    total = int(counts.sum())
+    coords = np.zeros((total, 2))
+    found = np.zeros(total, dtype=bool)
+    by_inline = np.repeat(inline, counts)
+    if inline.any():
+        # Overpass writes null for nodes it could not resolve.
+        flat = np.fromiter(
+            chain.from_iterable(
+                (p["lon"], p["lat"]) if p else (np.nan, np.nan)
+                for way in ways.values()
+                if "geometry" in way
+                for p in way["geometry"]
+            ),
+            np.float64,
+            count=2 * int(counts[inline].sum()),
+        ).reshape(-1, 2)
+        coords[by_inline] = flat
+        found[by_inline] = ~np.isnan(flat[:, 0])
+    if not inline.all():
+        refs = np.fromiter(
+            chain.from_iterable(
+                way.get("nodes", [])
+                for way in ways.values()
+                if "geometry" not in way
+            ),
+            np.int64,
+            count=int(counts[~inline].sum()),
+        )
+        coords[~by_inline], found[~by_inline] = store.lookup(refs)
+    return counts, coords, found
+
+
+def _build_ways(
+    ways: Dict[int, Dict[str, Any]], store: NodeStore
+) -> Tuple[Dict[int, Polygon], Dict[int, LineString], Dict[int, str]]:
+    way_polys: Dict[int, Polygon] = {}
+    way_lines: Dict[int, LineString] = {}
+    invalid_ways: Dict[int, str] = {}
+    wids = list(ways)
+    n = len(wids)
+    if not n:
+        return way_polys, way_lines, invalid_ways
+
+    counts, coords, found = way_coords(ways, store)
+    owner = np.repeat(np.arange(n), counts)
+
+    missing = np.bincount(owner[~found], minlength=n) > 0
+    has_line = ~missing & (counts >= 2)
+
+    starts = np.cumsum(counts) - counts
+    ends = starts + counts - 1
+    closed = has_line & (counts >= 3)
+    closed[closed] = np.all(coords[starts[closed]] == coords[ends[closed]], axis=1)
+    # A closed ring needs four coordinates; shorter ones cannot be polygons.
+    short_rings = closed & (counts < 4)
+    closed &= ~short_rings
+
+    lines = np.full(n, None, dtype=object)
+    keep = has_line[owner]
+    shapely.linestrings(coords[keep], indices=owner[keep], out=lines)
+
+    rings = np.full(n, None, dtype=object)
+    keep = closed[owner]
+    shapely.linearrings(coords[keep], indices=owner[keep], out=rings)
+    ring_ok = closed & shapely.is_valid(rings)
+    polys = shapely.polygons(np.where(ring_ok, rings, None))
+    poly_ok = ring_ok & shapely.is_valid(polys) & ~shapely.is_empty(polys)
+
+    for k, wid in enumerate(wids):
+        if not has_line[k]:
+            invalid_ways[wid] = "missing nodes"
+            continue
+        way_lines[wid] = lines[k]
+        if short_rings[k] or (closed[k] and not ring_ok[k]):
+            invalid_ways[wid] = "invalid ring"
+        elif ring_ok[k] and not poly_ok[k]:
+            invalid_ways[wid] = "invalid polygon"
+        elif poly_ok[k]:
+            way_polys[wid] = polys[k]
+
+    return way_polys, way_lines, invalid_ways
+
+
+def index_elements(
+    elements: Iterable[Dict[str, Any]],
+) -> Tuple[
+    NodeStore, Dict[int, Dict[str, Any]], List[Dict[str, Any]], List[ElementKey]
+]:
+    """Split raw elements into a node store, ways by id and relations.
+
+    ``elements`` is consumed once, so it may be a streaming iterator; node
+    dicts are dropped as soon as their coordinates are stored. Member way
+    geometry inlined by ``out geom`` becomes an untagged way, like the
+    skeleton ways ``>;`` would return. The returned keys record the input
+    order of the ways and relations.
+    """
+    node_ids: array = array("q")
+    node_lons: array = array("d")
+    node_lats: array = array("d")
+    ways: Dict[int, Dict[str, Any]] = {}
+    rels: List[Dict[str, Any]] = []
+    order: List[ElementKey] = []
+    member_ways: Dict[int, Dict[str, Any]] = {}
+    for el in elements:
+        if el["type"] == "node":
+            node_ids.append(el["id"])
+            node_lons.append(el["lon"])
+            node_lats.append(el["lat"])
+        elif el["type"] == "way":
+            ways[el["id"]] = el
+            order.append(("way", el["id"]))
+        elif el["type"] == "relation":
+            for m in el.get("members", []):
+                # ``out geom`` inlines member way geometry instead of
+                # returning the member ways as elements.
+                # The member is left as is so the input can be built again.
+                if m.get("type") == "way" and "geometry" in m:
+                    member_ways.setdefault(
+                        m["ref"],
+                        {"type": "way", "id": m["ref"], "geometry": m["geometry"]},
+                    )
+            rels.append(el)
+            order.append(("relation", el["id"]))
+    for wid, way in member_ways.items():
+        if wid not in ways:
+            ways[wid] = way
+            order.append(("way", wid))
+    return index_nodes(node_ids, node_lons, node_lats), ways, rels, order
+
+
+def _is_building_rel(rel: Dict[str, Any]) -> bool:
+    tags = rel.get("tags", {})
+    return "building" in tags or tags.get("leisure") == "stadium"
 
 
 def build_geometries(osm_data: Dict[str, Any]) -> Tuple[
@@ -15,45 +217,186 @@ def build_geometries(osm_data: Dict[str, Any]) -> Tuple[
     Set[int],
     Set[int],
 ]:
-    print("Building geometries...")
-    elements = osm_data.get("elements", [])
-    nodes: Dict[int, Dict[str, Any]] = {
-        el["id"]: el for el in elements if el["type"] == "node"
-    }
-    ways: Dict[int, Dict[str, Any]] = {
-        el["id"]: el for el in elements if el["type"] == "way"
-    }
-    rels: List[Dict[str, Any]] = [el for el in elements if el["type"] == "relation"]
+    store, ways, rels, _ = index_elements(osm_data.get("elements", []))
+    return assemble_geometries(store, ways, rels)
 
-    way_polys: Dict[int, Polygon] = {}
-    way_lines: Dict[int, LineString] = {}
-    invalid_ways: Dict[int, str] = {}
-    for wid, way in ways.items():
-        coords, missing = [], False
-        for nid in way.get("nodes", []):
-            n = nodes.get(nid)
-            if not n:
-                missing = True
-                break
-            coords.append((n["lon"], n["lat"]))
-        if missing or len(coords) < 2:
-            invalid_ways[wid] = "missing nodes"
-            continue
 
-        way_lines[wid] = LineString(coords)
+def _join_rings(parts: List[BaseGeometry]) -> Optional[List[np.ndarray]]:
+    """Join way coordinates end to end into closed rings.
 
-        if len(coords) < 3 or coords[0] != coords[-1]:
-            continue
+    Endpoints are matched exactly through a dict, so this is linear in the
+    number of members. Returns None when an endpoint is shared by anything
+    other than exactly two open ways, i.e. when the rings are not simple.
+    """
+    rings: List[np.ndarray] = []
+    segments: List[np.ndarray] = []
+    heads: List[Tuple[float, float]] = []
+    tails: List[Tuple[float, float]] = []
+    for part in parts:
+        coords = shapely.get_coordinates(part)
+        head = tuple(coords[0].tolist())
+        tail = tuple(coords[-1].tolist())
+        if len(coords) >= 4 and head == tail:
+            rings.append(coords)
+        else:
+            segments.append(coords)
+            heads.append(head)
+            tails.append(tail)
 
-        ring = LinearRing(coords)
-        if not ring.is_valid:
-            invalid_ways[wid] = "invalid ring"
-            continue
-        poly = Polygon(ring)
-        if not poly.is_valid or poly.is_empty:
-            invalid_ways[wid] = "invalid polygon"
+    ends: Dict[Tuple[float, float], List[int]] = {}
+    for i in range(len(segments)):
+        ends.setdefault(heads[i], []).append(i)
+        ends.setdefault(tails[i], []).append(i)
+    if any(len(at) != 2 for at in ends.values()):
+        return None
+
+    used = [False] * len(segments)
+    for i in range(len(segments)):
+        if used[i]:
             continue
-        way_polys[wid] = poly
+        used[i] = True
+        pieces = [segments[i]]
+        start, end = heads[i], tails[i]
+        cur = i
+        while end != start:
+            a, b = ends[end]
+            cur = b if a == cur else a
+            if used[cur]:
+                return None
+            used[cur] = True
+            if heads[cur] == end:
+                pieces.append(segments[cur][1:])
+                end = tails[cur]
+            else:
+                pieces.append(segments[cur][-2::-1])
+                end = heads[cur]
+        ring = np.concatenate(pieces)
+        if len(ring) < 4:
+            return None
+        rings.append(ring)
+    return rings
+
+
+def _ring_polygons(rings: List[np.ndarray]) -> np.ndarray:
+    counts = [len(ring) for ring in rings]
+    indices = np.repeat(np.arange(len(rings)), counts)
+    return shapely.polygons(
+        shapely.linearrings(np.concatenate(rings), indices=indices)
+    )
+
+
+def _ring_multipolygon(
+    outers: List[BaseGeometry], inners: List[BaseGeometry]
+) -> Optional[Union[Polygon, MultiPolygon]]:
+    """Build a relation polygon directly from its member rings.
+
+    Covers the common case of simple, non-overlapping outer rings with holes
+    inside them. Returns None whenever the input needs the overlay path:
+    open or branching rings, overlapping or nested outers, holes that fall
+    outside every outer, or a result that is not valid.
+    """
+    outer_rings = _join_rings(outers)
+    inner_rings = _join_rings(inners)
+    if not outer_rings or inner_rings is None:
+        return None
+    shells = _ring_polygons(outer_rings)
+    if not shapely.is_valid(shells).all():
+        return None
+    if len(shells) > 1 and not MultiPolygon(list(shells)).is_valid:
+        return None
+
+    holes: List[List[np.ndarray]] = [[] for _ in shells]
+    if inner_rings:
+        hole_polys = _ring_polygons(inner_rings)
+        tree = shapely.STRtree(shells)
+        inner_idx, shell_idx = tree.query(hole_polys, predicate="covered_by")
+        # Every hole must sit inside exactly one shell.
+        if sorted(inner_idx.tolist()) != list(range(len(inner_rings))):
+            return None
+        for k, owner in zip(inner_idx.tolist(), shell_idx.tolist()):
+            holes[owner].append(inner_rings[k])
+
+    polys = [
+        Polygon(shell.exterior, rings) for shell, rings in zip(shells, holes)
+    ]
+    merged = polys[0] if len(polys) == 1 else MultiPolygon(polys)
+    return merged if merged.is_valid else None
+
+
+def _overlay_multipolygon(
+    outer_polys: List[Polygon],
+    outer_lines: List[LineString],
+    inner_polys: List[Polygon],
+    inner_lines: List[LineString],
+) -> Optional[BaseGeometry]:
+    """Build a relation polygon with unions and polygonize (robust, slow)."""
+    merged: Optional[BaseGeometry] = None
+    if outer_polys:
+        merged = unary_union(outer_polys)
+    if outer_lines:
+        line_union = unary_union(outer_lines)
+        merged_lines = linemerge(line_union)
+        line_polys = list(polygonize(merged_lines))
+        if line_polys:
+            poly_union = unary_union(line_polys)
+            merged = poly_union if merged is None else unary_union([merged, poly_union])
+    if merged:
+        merged = merged.buffer(0)
+
+    if merged and (inner_polys or inner_lines):
+        inner_geoms: List[Polygon] = []
+        if inner_polys:
+            inner_geoms.extend(inner_polys)
+        if inner_lines:
+            inner_line_union = unary_union(inner_lines)
+            merged_inner_lines = linemerge(inner_line_union)
+            inner_line_polys = list(polygonize(merged_inner_lines))
+            if inner_line_polys:
+                inner_geoms.extend(inner_line_polys)
+        if inner_geoms:
+            inner_union = unary_union(inner_geoms)
+            if not inner_union.is_empty:
+                merged = merged.difference(inner_union).buffer(0)
+
+    return merged
+
+
+def assemble_geometries(
+    store: NodeStore,
+    ways: Dict[int, Dict[str, Any]],
+    rels: List[Dict[str, Any]],
+    only: Optional[Set[ElementKey]] = None,
+) -> Tuple[
+    Dict[int, Dict[str, Any]],
+    List[Dict[str, Any]],
+    Dict[int, Polygon],
+    Dict[int, Union[Polygon, MultiPolygon]],
+    Set[int],
+    Set[int],
+]:
+    """Build way and relation polygons from indexed elements.
+
+    When ``only`` is given, geometry is built just for those ``(type, id)``
+    keys (and the member ways of listed relations); relation membership is
+    still recorded for every relation so skip sets stay complete.
+    """
+    print("Building geometries...")
+    if only is not None:
+        wanted = {oid for otype, oid in only if otype == "way"}
+        for rel in rels:
+            if ("relation", rel["id"]) in only:
+                wanted.update(
+                    m.get("ref")
+                    for m in rel.get("members", [])
+                    if m.get("type") == "way"
+                )
+        ways_to_build = {wid: way for wid, way in ways.items() if wid in wanted}
+    else:
+        ways_to_build = ways
+
+    with stage("build_ways") as counts:
+        way_polys, way_lines, invalid_ways = _build_ways(ways_to_build, store)
+        counts.update(ways=len(ways_to_build), polygons=len(way_polys))
 
     rel_polys: Dict[int, Union[Polygon, MultiPolygon]] = {}
     ways_in_building_rels: Set[int] = set()
@@ -62,82 +405,75 @@ def build_geometries(osm_data: Dict[str, Any]) -> Tuple[
 
     skipped_relations = {}
 
-    for rel in rels:
-        if "members" not in rel:
-            continue
-        outer_polys, outer_lines, inner_polys, inner_lines = [], [], [], []
-        missing_outers = []
-        for m in rel["members"]:
-            if m.get("type") != "way":
+    with stage("build_relations") as counts:
+        for rel in rels:
+            if "members" not in rel:
                 continue
-            wid = m.get("ref")
-            role = m.get("role")
-            poly = way_polys.get(wid)
-            line = way_lines.get(wid)
-            if role == "outer":
-                if poly:
-                    outer_polys.append(poly)
-                    tags = rel.get("tags", {})
-                    if "building" in tags or tags.get("leisure") == "stadium":
-                        ways_in_building_rels.add(wid)
-                elif line:
-                    outer_lines.append(line)
-                    tags = rel.get("tags", {})
-                    if "building" in tags or tags.get("leisure") == "stadium":
-                        ways_in_building_rels.add(wid)
-                else:
-                    missing_outers.append((wid, invalid_ways.get(wid, "missing way")))
-            elif role == "inner":
-                if poly:
-                    inner_polys.append(poly)
-                elif line:
-                    inner_lines.append(line)
-                else:
+            if only is not None and ("relation", rel["id"]) not in only:
+                # Unchanged relation: its own polygon is reused by the caller, but
+                # its member ways must still be skipped as standalone features.
+                for m in rel["members"]:
+                    if m.get("type") != "way":
+                        continue
+                    if m.get("role") == "outer" and _is_building_rel(rel):
+                        ways_in_building_rels.add(m.get("ref"))
+                    elif m.get("role") == "inner":
+                        ways_in_multipolygon_holes.add(m.get("ref"))
+                continue
+            outer_polys, outer_lines, inner_polys, inner_lines = [], [], [], []
+            missing_outers = []
+            for m in rel["members"]:
+                if m.get("type") != "way":
                     continue
-                ways_in_multipolygon_holes.add(wid)
-                inner_count += 1
+                wid = m.get("ref")
+                role = m.get("role")
+                poly = way_polys.get(wid)
+                line = way_lines.get(wid)
+                if role == "outer":
+                    if poly:
+                        outer_polys.append(poly)
+                        if _is_building_rel(rel):
+                            ways_in_building_rels.add(wid)
+                    elif line:
+                        outer_lines.append(line)
+                        if _is_building_rel(rel):
+                            ways_in_building_rels.add(wid)
+                    else:
+                        missing_outers.append(
+                            (wid, invalid_ways.get(wid, "missing way"))
+                        )
+                elif role == "inner":
+                    if poly:
+                        inner_polys.append(poly)
+                    elif line:
+                        inner_lines.append(line)
+                    else:
+                        continue
+                    ways_in_multipolygon_holes.add(wid)
+                    inner_count += 1
+
+            if missing_outers:
+                skipped_relations[rel["id"]] = missing_outers
+                print(
+                    f"  Skipping relation {rel['id']} due to missing outer ways: {missing_outers}"
+                )
+                continue
 
-        if missing_outers:
-            skipped_relations[rel["id"]] = missing_outers
-            print(
-                f"  Skipping relation {rel['id']} due to missing outer ways: {missing_outers}"
+            merged = _ring_multipolygon(
+                outer_polys + outer_lines, inner_polys + inner_lines
             )
-            continue
+            if merged is None:
+                merged = _overlay_multipolygon(
+                    outer_polys, outer_lines, inner_polys, inner_lines
+                )
 
-        merged = None
-        if outer_polys:
-            merged = unary_union(outer_polys)
-        if outer_lines:
-            line_union = unary_union(outer_lines)
-            merged_lines = linemerge(line_union)
-            line_polys = list(polygonize(merged_lines))
-            if line_polys:
-                poly_union = unary_union(line_polys)
-                merged = poly_union if merged is None else unary_union([merged, poly_union])
-        if merged:
-            merged = merged.buffer(0)
-
-        if merged and (inner_polys or inner_lines):
-            inner_geoms: List[Polygon] = []
-            if inner_polys:
-                inner_geoms.extend(inner_polys)
-            if inner_lines:
-                inner_line_union = unary_union(inner_lines)
-                merged_inner_lines = linemerge(inner_line_union)
-                inner_line_polys = list(polygonize(merged_inner_lines))
-                if inner_line_polys:
-                    inner_geoms.extend(inner_line_polys)
-            if inner_geoms:
-                inner_union = unary_union(inner_geoms)
-                if not inner_union.is_empty:
-                    merged = merged.difference(inner_union).buffer(0)
-
-        if (
-            merged
-            and isinstance(merged, (Polygon, MultiPolygon))
-            and not merged.is_empty
-        ):
-            rel_polys[rel["id"]] = merged
+            if (
+                merged
+                and isinstance(merged, (Polygon, MultiPolygon))
+                and not merged.is_empty
+            ):
+                rel_polys[rel["id"]] = merged
+        counts.update(relations=len(rels), polygons=len(rel_polys))
 
     if skipped_relations:
         print(
@@ -159,13 +495,133 @@ def build_geometries(osm_data: Dict[str, Any]) -> Tuple[
     )
 
 
+def _project(
+    geoms: GeometryLike, func: Callable[[np.ndarray, np.ndarray], Any]
+) -> GeometryLike:
+    # One pyproj call over the whole coordinate array instead of the
+    # per-ring Python callback used by shapely.ops.transform.
+    return shapely.transform(
+        geoms, lambda xy: np.column_stack(func(xy[:, 0], xy[:, 1]))
+    )
+
+
+def to_metres(geoms: GeometryLike) -> GeometryLike:
+    """Project a geometry or array of geometries from WGS84 to EPSG:3310."""
+    return _project(geoms, _TO_M)
+
+
+def to_degrees(geoms: GeometryLike) -> GeometryLike:
+    """Project a geometry or array of geometries from EPSG:3310 to WGS84."""
+    return _project(geoms, _TO_DEG)
+
+
 def area_m2(geom: BaseGeometry) -> float:
-    return transform(_TO_M, geom).area
+    return to_metres(geom).area
 
 
 def simplify_geom_m(geom: BaseGeometry, tol_m: float) -> Optional[BaseGeometry]:
-    g_m = transform(_TO_M, geom)
+    g_m = to_metres(geom)
     g_s = g_m.simplify(tol_m, preserve_topology=True)
     if g_s.is_empty:
         return None
-    return transform(_TO_DEG, g_s)
+    return to_degrees(g_s)
+
+
+def _coverage_layers(geoms_m: np.ndarray) -> List[np.ndarray]:
+    """Split polygons into layers whose members never overlap each other.
+
+    Greedy colouring in input order: each polygon joins the first layer that
+    holds none of the polygons its interior intersects. Touching buildings
+    therefore share a layer, and nested ones (a building inside its campus
+    area) land in separate layers.
+    """
+    tree = shapely.STRtree(geoms_m)
+    left, right = tree.query(geoms_m, predicate="intersects")
+    pairs = left < right
+    left, right = left[pairs], right[pairs]
+    overlap = shapely.relate_pattern(geoms_m[left], geoms_m[right], "T********")
+    conflicts: Dict[int, List[int]] = {}
+    for i, j in zip(left[overlap].tolist(), right[overlap].tolist()):
+        conflicts.setdefault(j, []).append(i)
+    layer_of = [0] * len(geoms_m)
+    for j in range(len(geoms_m)):
+        taken = {layer_of[i] for i in conflicts.get(j, ())}
+        layer = 0
+        while layer in taken:
+            layer += 1
+        layer_of[j] = layer
+    layer_arr = np.array(layer_of, dtype=np.int64)
+    return [
+        np.flatnonzero(layer_arr == layer)
+        for layer in range(int(layer_arr.max()) + 1 if len(layer_arr) else 0)
+    ]
+
+
+def label_points_m(geoms_m: Sequence[BaseGeometry], tol_m: float) -> np.ndarray:
+    """Pole of inaccessibility of each EPSG:3310 polygon, to within ``tol_m``.
+
+    Unlike the centroid this always lies inside the polygon, as far from its
+    edges as possible. Uses the vectorised maximum inscribed circle of
+    shapely 2.1+, falling back to polylabel on the largest part.
+    """
+    geoms_m = np.asarray(geoms_m, dtype=object)
+    if hasattr(shapely, "maximum_inscribed_circle"):
+        return shapely.get_point(shapely.maximum_inscribed_circle(geoms_m, tol_m), 0)
+    from shapely.ops import polylabel
+
+    return np.array(
+        [
+            polylabel(max(shapely.get_parts(g), key=lambda p: p.area), tol_m)
+            for g in geoms_m
+        ],
+        dtype=object,
+    )
+
+
+def hilbert_order(
+    xy: np.ndarray, bounds: Tuple[float, float, float, float], bits: int = 16
+) -> np.ndarray:
+    """Return the permutation sorting points ``xy`` along a Hilbert curve.
+
+    Points are scaled onto a ``2**bits`` grid over the fixed ``bounds``
+    (west, south, east, north) and clamped to it, so a point keeps its curve
+    position whatever other points are added or removed.
+    """
+    if not len(xy):
+        return np.zeros(0, dtype=np.int64)
+    n = 1 << bits
+    lo = np.array(bounds[:2], dtype=float)
+    span = np.array(bounds[2:], dtype=float) - lo
+    grid = np.clip(np.floor((xy - lo) / span * n), 0, n - 1).astype(np.int64)
+    x, y = grid[:, 0], grid[:, 1]
+    d = np.zeros(len(xy), dtype=np.int64)
+    s = n >> 1
+    while s:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # Rotate the quadrant so the curve stays continuous.
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+    return np.argsort(d, kind="stable")
+
+
+def simplify_coverage_m(geoms_m: Sequence[BaseGeometry], tol_m: float) -> np.ndarray:
+    """Simplify EPSG:3310 polygons together, keeping shared edges shared.
+
+    Each layer of non-overlapping polygons is simplified as one coverage, so
+    an edge two buildings share is simplified once and they neither gap nor
+    overlap afterwards. Coverage simplification (shapely 2.1+) never drops a
+    polygon, it bottoms out at a triangle. Older shapely falls back to
+    simplifying each polygon on its own.
+    """
+    geoms_m = np.asarray(geoms_m, dtype=object)
+    if not hasattr(shapely, "coverage_simplify"):
+        return shapely.simplify(geoms_m, tol_m, preserve_topology=True)
+    result = np.empty(len(geoms_m), dtype=object)
+    for members in _coverage_layers(geoms_m):
+        result[members] = shapely.coverage_simplify(geoms_m[members], tol_m)
+    return result
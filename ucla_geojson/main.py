@@ -1,21 +1,206 @@
+import argparse
+import json
+from pathlib import Path
 from time import perf_counter
-from typing import Any, Callable, TypeVar
+from typing import Any, Callable, List, Optional, TypeVar
 
 from .builder import process_features
+from .cache import ResponseCache
+from .classification import disable_stats, enable_stats
+from .constants import (
+    BUILD_WORKERS,
+    CACHE_TTL_S,
+    COORD_PRECISION,
+    FETCH_CONCURRENCY,
+    LOD_TOLERANCES_M,
+)
+from .extract import read_extract
 from .fetcher import fetch_osm_data
+from .metrics import Metrics, activate, stage
+from .overpass import OverpassClient
+from .state import BuildState
 from .writer import write_single
 
 
 T = TypeVar("T")
 
 
-def main() -> None:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build public/campus.geojson")
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="ignore the stored build state and rebuild every feature",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="parse Overpass responses incrementally instead of loading them "
+        "whole (fetch time is then counted under process_features)",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--refresh",
+        action="store_true",
+        help="refetch every Overpass response even if a cached copy is fresh",
+    )
+    mode.add_argument(
+        "--offline",
+        action="store_true",
+        help="only use cached Overpass responses, even expired ones",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=CACHE_TTL_S / 3600,
+        metavar="HOURS",
+        help="age after which a cached response is refetched (default: %(default)g)",
+    )
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="fetch BBOX as an adaptive quadtree of tiles (for large areas)",
+    )
+    parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        default=FETCH_CONCURRENCY,
+        metavar="N",
+        help="maximum simultaneous Overpass requests (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BUILD_WORKERS,
+        metavar="N",
+        help="processes used to build features; 0 means one per CPU and 1 "
+        "builds serially (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--classification-stats",
+        type=Path,
+        metavar="PATH",
+        help="write per-rule classification hit counts and timing as JSON "
+        "(implies --full-rebuild)",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        metavar="PATH",
+        help="write per-stage wall/CPU time, peak memory (tracemalloc) and "
+        "counts as JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        metavar="DIR",
+        help="write a cProfile <stage>.pstats dump per top-level stage to DIR",
+    )
+    parser.add_argument(
+        "--geom",
+        action="store_true",
+        help="ask Overpass for inline way geometry (out geom) instead of "
+        "separate node elements",
+    )
+    parser.add_argument(
+        "--extract",
+        type=Path,
+        metavar="PATH",
+        help="read a local .osm/.osm.pbf extract instead of querying Overpass",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="quantize and minify the output, add campus.topojson and write "
+        ".gz/.br copies",
+    )
+    parser.add_argument(
+        "--precision",
+        type=int,
+        default=COORD_PRECISION,
+        metavar="N",
+        help="decimal places kept by --compact (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-lod",
+        action="store_true",
+        help="skip the coarser campus.lod<N>m.geojson MapView draws at low zoom",
+    )
+    parser.add_argument(
+        "--tiles",
+        action="store_true",
+        help="also write a z/x/y Mapbox Vector Tile pyramid to public/tiles",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
     print("Starting build_ucla_geojson...")
     start_time = perf_counter()
+    metrics = Metrics(trace_memory=bool(args.metrics), profile_dir=args.profile)
+    activate(metrics)
+    metrics.start()
+
+    cache = ResponseCache(
+        ttl=args.cache_ttl * 3600, refresh=args.refresh, offline=args.offline
+    )
+    # Stats must see every element, not just the ones an incremental build
+    # reclassifies, so recording them implies a full rebuild.
+    full = args.full_rebuild or bool(args.classification_stats)
+    state = BuildState() if full else BuildState.load()
+    client = OverpassClient(concurrency=args.fetch_workers)
+    if args.classification_stats:
+        enable_stats()
+    if args.extract:
+        # read_extract is lazy; it runs while process_features consumes it.
+        data = {"elements": read_extract(args.extract)}
+    else:
+        data = timed(
+            "fetch_osm_data",
+            fetch_osm_data,
+            split=True,
+            stream=args.stream,
+            cache=cache,
+            client=client,
+            tiled=args.tiled,
+            geom=args.geom,
+        )
+    features = timed(
+        "process_features",
+        process_features,
+        data,
+        state,
+        args.workers,
+        () if args.no_lod else LOD_TOLERANCES_M,
+    )
+    timed(
+        "write_single",
+        write_single,
+        features,
+        args.compact,
+        args.precision,
+        args.tiles,
+    )
+    timed("save_state", state.save)
+
+    stats = disable_stats()
+    if stats is not None:
+        report = stats.report()
+        with open(args.classification_stats, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(
+            f"Classified {report['features']} features in "
+            f"{report['seconds']:.3f}s (mean depth {report['mean_depth']}, "
+            f"{len(report['never_fired'])} rules never fired); "
+            f"wrote {args.classification_stats}"
+        )
 
-    data = timed("fetch_osm_data", fetch_osm_data, split=True)
-    features = timed("process_features", process_features, data)
-    timed("write_single", write_single, features)
+    metrics.stop()
+    activate(None)
+    if args.metrics:
+        metrics.write(args.metrics)
+        print(f"Wrote stage metrics to {args.metrics}")
 
     total_time = perf_counter() - start_time
     print(
@@ -24,8 +209,11 @@ def main() -> None:
 
 
 def timed(label: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
-    start = perf_counter()
-    result = func(*args, **kwargs)
-    duration = perf_counter() - start
+    with stage(label) as counts:
+        start = perf_counter()
+        result = func(*args, **kwargs)
+        duration = perf_counter() - start
+        if isinstance(result, list):
+            counts["items"] = len(result)
     print(f"({label} took {duration:.2f} seconds)")
     return result
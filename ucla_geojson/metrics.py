@@ -0,0 +1,133 @@
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Metrics:
+    """Records wall/CPU time, peak traced memory and counts per build stage.
+
+    Stages nest: a stage opened while another is running is recorded with a
+    ``parent/child`` path, and records are listed in the order stages
+    started. Memory is only traced when ``trace_memory`` is set, since
+    tracemalloc slows Python down noticeably. With ``profile_dir`` every
+    top-level stage also writes a ``<stage>.pstats`` cProfile dump there.
+    """
+
+    def __init__(
+        self, trace_memory: bool = False, profile_dir: Optional[Path] = None
+    ) -> None:
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.records: List[Dict[str, Any]] = []
+        self._stack: List[Dict[str, Any]] = []
+        self.started_at = datetime.now(timezone.utc)
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profile_dir:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+
+    def stop(self) -> None:
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Time a stage; the yielded dict collects its counts."""
+        path = "/".join([r["name"] for r in self._stack] + [name])
+        record: Dict[str, Any] = {"name": name, "stage": path, "counts": {}}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # reset_peak below would lose the parent's peak so far.
+                parent = self._stack[-1]
+                parent["_peak"] = max(parent["_peak"], peak)
+            tracemalloc.reset_peak()
+            record["_start_mem"] = current
+            record["_peak"] = current
+        profiler = None
+        if self.profile_dir and not self._stack:
+            profiler = cProfile.Profile()
+        self._stack.append(record)
+        self.records.append(record)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record["counts"]
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(str(self.profile_dir / f"{name}.pstats"))
+            record["wall_s"] = round(time.perf_counter() - wall, 6)
+            record["cpu_s"] = round(time.process_time() - cpu, 6)
+            self._stack.pop()
+            if tracing:
+                peak = max(record.pop("_peak"), tracemalloc.get_traced_memory()[1])
+                record["peak_bytes"] = peak - record.pop("_start_mem")
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent["_peak"] = max(parent["_peak"], peak)
+
+    def record(self, name: str, wall_s: float, counts: Dict[str, Any]) -> None:
+        """Add a stage timed elsewhere, such as on a worker thread.
+
+        It is nested under the stages currently open, like stage() would.
+        """
+        path = "/".join([r["name"] for r in self._stack] + [name])
+        self.records.append(
+            {
+                "name": name,
+                "stage": path,
+                "counts": counts,
+                "wall_s": round(wall_s, 6),
+            }
+        )
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at.isoformat().replace("+00:00", "Z"),
+            "trace_memory": self.trace_memory,
+            "stages": self.records,
+        }
+
+    def write(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+# The Metrics instance of the running build, if any; pipeline modules report
+# sub-stages through stage() without having to thread it through.
+_active: Optional[Metrics] = None
+
+
+def activate(metrics: Optional[Metrics]) -> None:
+    global _active
+    _active = metrics
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Dict[str, Any]]:
+    """Record ``name`` as a (sub-)stage of the active Metrics, if any."""
+    if _active is None:
+        yield {}
+        return
+    with _active.stage(name) as counts:
+        yield counts
+
+
+def record(name: str, wall_s: float, **counts: Any) -> None:
+    """Record an already timed ``name`` in the active Metrics, if any."""
+    if _active is not None:
+        _active.record(name, wall_s, counts)
+
+
+__all__ = ["Metrics", "activate", "record", "stage"]
@@ -0,0 +1,230 @@
+import http.client
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cache import ResponseCache, is_error_remark
+from .constants import (
+    FETCH_BACKOFF_S,
+    FETCH_CONCURRENCY,
+    FETCH_MAX_BACKOFF_S,
+    FETCH_RETRIES,
+    FETCH_TIMEOUT_S,
+    OVERPASS_URL,
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+_OSM_BASE_RE = re.compile(rb'"timestamp_osm_base"\s*:\s*"([^"]+)"')
+_REMARK_RE = re.compile(rb'"remark"\s*:\s*("(?:[^"\\]|\\.)*")')
+_COPY_CHUNK = 1 << 16
+_PEEK_BYTES = 4096
+
+
+class RetryableError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class OverpassClient:
+    """Thread-safe Overpass HTTP client with retries and connection reuse.
+
+    Each worker thread keeps one persistent connection per host. Failed
+    requests (connection errors, timeouts and 429/5xx responses) are retried
+    with exponential backoff and full jitter, honouring ``Retry-After``.
+    """
+
+    def __init__(
+        self,
+        endpoint: Optional[str] = None,
+        concurrency: int = FETCH_CONCURRENCY,
+        timeout: float = FETCH_TIMEOUT_S,
+        retries: int = FETCH_RETRIES,
+        backoff: float = FETCH_BACKOFF_S,
+        max_backoff: float = FETCH_MAX_BACKOFF_S,
+    ) -> None:
+        self.endpoint = endpoint or OVERPASS_URL
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._local = threading.local()
+
+    def url_for(self, query: str) -> str:
+        return f"{self.endpoint}?{urllib.parse.urlencode({'data': query})}"
+
+    def _connection(
+        self, scheme: str, netloc: str
+    ) -> http.client.HTTPConnection:
+        conns: Dict[Tuple[str, str], http.client.HTTPConnection] = getattr(
+            self._local, "conns", None
+        ) or {}
+        self._local.conns = conns
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            conn = cls(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+        return conn
+
+    def _drop_connection(self, scheme: str, netloc: str) -> None:
+        conns = getattr(self._local, "conns", {})
+        conn = conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def _download_once(self, url: str, cache: ResponseCache) -> int:
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        conn = self._connection(parts.scheme, parts.netloc)
+        try:
+            conn.request("GET", path, headers={"Accept-Encoding": "identity"})
+            resp = conn.getresponse()
+            if resp.status != 200:
+                body = resp.read()
+                message = f"HTTP {resp.status} from Overpass: {body[:200]!r}"
+                if resp.status in RETRY_STATUSES:
+                    raise RetryableError(
+                        message, _retry_after(resp.getheader("Retry-After"))
+                    )
+                raise RuntimeError(message)
+            size = 0
+            with cache.store(url) as (sink, info):
+                head = tail = b""
+                while True:
+                    chunk = resp.read(_COPY_CHUNK)
+                    if not chunk:
+                        break
+                    if len(head) < _PEEK_BYTES:
+                        head += chunk[:_PEEK_BYTES]
+                    tail = (tail + chunk)[-_PEEK_BYTES:]
+                    sink.write(chunk)
+                    size += len(chunk)
+                # Overpass puts osm3s before the elements and any runtime
+                # error remark after them.
+                match = _OSM_BASE_RE.search(head)
+                if match:
+                    info["timestamp_osm_base"] = match.group(1).decode()
+                match = _REMARK_RE.search(tail)
+                if match:
+                    info["remark"] = json.loads(match.group(1))
+                if is_error_remark(info.get("remark")):
+                    # A timeout comes back as a 200 with partial elements;
+                    # raising here also keeps it out of the cache.
+                    raise RetryableError(f"Overpass {info['remark']}")
+                info["bytes"] = size
+            if resp.will_close:
+                self._drop_connection(parts.scheme, parts.netloc)
+            return size
+        except (OSError, http.client.HTTPException, RetryableError):
+            # The connection state is unknown after a failure; start afresh.
+            self._drop_connection(parts.scheme, parts.netloc)
+            raise
+
+    def download(
+        self, url: str, cache: ResponseCache, retries: Optional[int] = None
+    ) -> int:
+        """Fetch ``url`` into ``cache``, retrying transient failures."""
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                return self._download_once(url, cache)
+            except RetryableError as e:
+                error: Exception = e
+                retry_after = e.retry_after
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+                retry_after = None
+            if attempt == retries:
+                raise RuntimeError(
+                    f"Overpass request failed after {attempt + 1} attempts: {error}"
+                ) from error
+            delay = self._delay(attempt, retry_after)
+            print(f"  Retrying in {delay:.1f}s after: {error}")
+            time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def prefetch(
+        self,
+        queries: Iterable[str],
+        cache: ResponseCache,
+        errors: Optional[Dict[str, Exception]] = None,
+        retries: Optional[int] = None,
+        timings: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> List[str]:
+        """Make sure every query has a usable cache entry.
+
+        Missing or stale entries are downloaded concurrently, at most
+        ``concurrency`` at a time. Returns the URL of each query in order.
+        When ``errors`` is given, failed downloads are recorded there by URL
+        instead of raised. When ``timings`` is given, each download's wall
+        time (retries included) and size are recorded there by URL.
+        """
+        urls = [self.url_for(q) for q in queries]
+        missing = []
+        for url in urls:
+            cached = cache.open(url)
+            if cached is None:
+                missing.append(url)
+            else:
+                cached.close()
+        if not missing:
+            return urls
+
+        def fetch(url: str) -> None:
+            print(f"  Fetching {cache.key(url)[:16]}")
+            start = time.perf_counter()
+            try:
+                size = self.download(url, cache, retries)
+            except RuntimeError as e:
+                if timings is not None:
+                    timings[url] = {
+                        "wall_s": time.perf_counter() - start,
+                        "error": str(e),
+                    }
+                if errors is None:
+                    raise
+                errors[url] = e
+                return
+            if timings is not None:
+                timings[url] = {"wall_s": time.perf_counter() - start, "bytes": size}
+            print(f"  Downloaded {size} bytes for {cache.key(url)[:16]}")
+
+        workers = min(self.concurrency, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(fetch, missing):
+                pass
+        return urls
+
+
+__all__ = ["OverpassClient", "RetryableError"]
@@ -1,43 +1,25 @@
 import json
-from typing import Any, Dict, List, Set, Tuple
+from collections import Counter
+from typing import Any, Dict, List
 
+from .classification import RuleSet, _includes, _or
 from .fetcher import fetch_osm_data
+from .query import load_campus
 
 
 def open_campus() -> List[Dict[str, Any]]:
-    with open("public/campus.geojson", "r") as f:
-        campus: List[Dict[str, Any]] = json.load(f)["features"]
-        return campus
+    return load_campus().features
 
 
 def probe_duplicate_centroids() -> None:
-    campus = open_campus()
-    centroids_found: Set[Tuple[float, float]] = set()
-    duplicate_centroids: Set[Tuple[float, float]] = set()
-
-    for feature in campus:
-        props = feature["properties"]
-        centroid: Tuple[float, float] = tuple(props["centroid"])
-        if centroid in centroids_found:
-            duplicate_centroids.add(centroid)
-        centroids_found.add(centroid)
-
-    for feature in campus:
-        props = feature["properties"]
-        centroid: Tuple[float, float] = tuple(props["centroid"])
-        if centroid in duplicate_centroids:
-            print(props["centroid"], props["name"])
+    for centroid, group in load_campus().query().group_by("centroid").items():
+        if len(group) > 1:
+            for props in group.props("centroid", "name"):
+                print(props["centroid"], props["name"])
 
 
 def feature_type_tree() -> None:
-    campus = open_campus()
-    categories: Set[str] = set()
-
-    for feature in campus:
-        props = feature["properties"]
-        categories.add(props["category"])
-
-    print(*sorted(categories), sep="\n")
+    print(*sorted(load_campus().fields["category"]), sep="\n")
 
 
 def probe_names_categories() -> None:
@@ -46,11 +28,7 @@ def probe_names_categories() -> None:
         feature["properties"]["name"]: feature["properties"]["category"]
         for feature in campus
     }
-    categories_dups = list(names_categories.values())
-    categories = iter(set(names_categories.values()))
-    category_counts: Dict[str, int] = {
-        category: categories_dups.count(category) for category in categories
-    }
+    category_counts: Dict[str, int] = dict(Counter(names_categories.values()))
     print(category_counts)
     with open("probe/names_categories.json", "w", encoding="utf-8") as f:
         json.dump(names_categories, f, ensure_ascii=False, indent=2)
@@ -58,29 +36,26 @@ def probe_names_categories() -> None:
 
 def probe_info() -> None:
     data = fetch_osm_data()
+    by_osm_id = load_campus().fields["osm_id"]
     campus = open_campus()
 
     info = {}
     found_count = {}
-    for x in range(len(data["elements"])):
-        element = data["elements"][x]
+    for element in data["elements"]:
         if element["type"] == "node":
             continue
 
-        name = ""
-        for feature in campus:
-            props = feature["properties"]
-            if props["osm_ids"][0].endswith(str(element["id"])):
-                if props["name"] in found_count:
-                    found_count[props["name"]] += 1
-                    name = props["name"] + f" {found_count[props["name"]]}"
-                else:
-                    found_count[props["name"]] = 1
-                    name = props["name"]
-                zone = props["zone"]
-                break
-        if name == "":
+        rows = by_osm_id.get(element["id"])
+        if not rows:
             continue
+        props = campus[rows[0]]["properties"]
+        if props["name"] in found_count:
+            found_count[props["name"]] += 1
+            name = props["name"] + f" {found_count[props["name"]]}"
+        else:
+            found_count[props["name"]] = 1
+            name = props["name"]
+        zone = props["zone"]
 
         tags = element.get("tags") or {}
 
@@ -122,12 +97,10 @@ def transpose_verified_categories() -> None:
         json.dump(by_category, f, ensure_ascii=False, indent=2)
 
 
-def C_includes(*args):
-    return lambda x: any(arg in x for arg in args)
-
-
-def C_or(*args):
-    return lambda x: x in args
+# The rule targets must be the classification ones for RuleSet to index
+# them instead of calling them one by one.
+C_includes = _includes
+C_or = _or
 
 
 CLASSIFICATION = [
@@ -294,34 +267,23 @@ def new_classification() -> None:
     with open("verified_categories.json", "r") as f:
         verified_categories = json.load(f)
 
+    rules = RuleSet(CLASSIFICATION)
     correct = 0
     incorrect = 0
     unassigned = 0
     for name, feature_tags in verified_categories.items():
-        for cat, rule in CLASSIFICATION:
-            for rule_tag, rule_target in rule.items():
-                if rule_tag not in feature_tags:
-                    break
-                if callable(rule_target):
-                    if not rule_target(feature_tags[rule_tag]):
-                        break
-                elif feature_tags[rule_tag] != rule_target:
-                    break
-            else:
-                feature_tags["calculated_category"] = cat
-                if cat == feature_tags["category"]:
-                    correct += 1
-                elif cat == "Unassigned":
-                    unassigned += 1
-                    print(
-                        f"{name} is {feature_tags["category"]} but is unassigned"
-                    )
-                else:
-                    incorrect += 1
-                    print(
-                        f"{name} is {feature_tags["category"]} but calculated {cat}"
-                    )
-                break
+        cat = rules.category(feature_tags)
+        if cat is None:
+            continue
+        feature_tags["calculated_category"] = cat
+        if cat == feature_tags["category"]:
+            correct += 1
+        elif cat == "Unassigned":
+            unassigned += 1
+            print(f"{name} is {feature_tags["category"]} but is unassigned")
+        else:
+            incorrect += 1
+            print(f"{name} is {feature_tags["category"]} but calculated {cat}")
 
     print(f"{correct} correct")
     print(f"{incorrect} incorrect")
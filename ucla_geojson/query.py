@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+from collections import defaultdict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+import shapely
+from shapely.geometry import box, shape
+from shapely.geometry.base import BaseGeometry
+
+CAMPUS_FILE: str = "public/campus.geojson"
+
+# Properties with a hash index; equality filters on them skip the scan.
+INDEXED_FIELDS: Tuple[str, ...] = ("id", "osm_id", "name", "category", "zone")
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+class CampusIndex:
+    """Built features loaded once, with hash indexes and a spatial index.
+
+    ``fields[name][value]`` lists the rows (positions in ``features``) whose
+    property ``name`` equals ``value`` for every name in INDEXED_FIELDS. The
+    STRtree over the feature geometries is built on first spatial query.
+    """
+
+    def __init__(self, features: List[Dict[str, Any]]) -> None:
+        self.features = features
+        self.fields: Dict[str, Dict[Any, List[int]]] = {
+            name: defaultdict(list) for name in INDEXED_FIELDS
+        }
+        for row, feature in enumerate(features):
+            props = feature["properties"]
+            for name, index in self.fields.items():
+                if name in props:
+                    index[_hashable(props[name])].append(row)
+        self._geoms: Optional[np.ndarray] = None
+        self._tree: Optional[shapely.STRtree] = None
+
+    @classmethod
+    def load(cls, path: str = CAMPUS_FILE) -> "CampusIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["features"])
+
+    @property
+    def geoms(self) -> np.ndarray:
+        if self._geoms is None:
+            self._geoms = np.array(
+                [shape(f["geometry"]) for f in self.features], dtype=object
+            )
+        return self._geoms
+
+    @property
+    def tree(self) -> shapely.STRtree:
+        if self._tree is None:
+            self._tree = shapely.STRtree(self.geoms)
+        return self._tree
+
+    def query(self) -> "Query":
+        return Query(self, range(len(self.features)))
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+
+class Query:
+    """An immutable selection of rows of a CampusIndex.
+
+    Every filter returns a new Query, so filters compose by chaining:
+    ``index.query().where(zone="The Hill").intersects(area).group_by(...)``.
+    """
+
+    def __init__(self, index: CampusIndex, rows: Iterable[int]) -> None:
+        self.index = index
+        self.rows: List[int] = list(rows)
+
+    def _keep(self, rows: Iterable[int]) -> "Query":
+        keep = set(rows)
+        return Query(self.index, [r for r in self.rows if r in keep])
+
+    def where(self, **equals: Any) -> "Query":
+        """Keep features whose properties equal all of ``equals``."""
+        query = self
+        scanned = {}
+        for name, value in equals.items():
+            if name in self.index.fields:
+                query = query._keep(self.index.fields[name].get(_hashable(value), ()))
+            else:
+                scanned[name] = _hashable(value)
+        if scanned:
+            query = query.filter(
+                lambda props: all(
+                    _hashable(props.get(k)) == v for k, v in scanned.items()
+                )
+            )
+        return query
+
+    def filter(self, predicate: Callable[[Dict[str, Any]], bool]) -> "Query":
+        """Keep features whose properties satisfy ``predicate``."""
+        features = self.index.features
+        return Query(
+            self.index, [r for r in self.rows if predicate(features[r]["properties"])]
+        )
+
+    def intersects(self, geom: BaseGeometry) -> "Query":
+        return self._keep(self.index.tree.query(geom, predicate="intersects").tolist())
+
+    def within(self, geom: BaseGeometry) -> "Query":
+        return self._keep(self.index.tree.query(geom, predicate="contains").tolist())
+
+    def bbox(self, west: float, south: float, east: float, north: float) -> "Query":
+        return self.intersects(box(west, south, east, north))
+
+    def at(self, lon: float, lat: float) -> "Query":
+        """Keep features containing the point (lon, lat)."""
+        return self.intersects(shapely.Point(lon, lat))
+
+    def group_by(
+        self, key: Union[str, Callable[[Dict[str, Any]], Any]]
+    ) -> Dict[Any, "Query"]:
+        """Split into one Query per value of property ``key`` (or ``key(props)``)."""
+        get = key if callable(key) else (lambda props: props.get(key))
+        groups: Dict[Any, List[int]] = defaultdict(list)
+        for r in self.rows:
+            groups[_hashable(get(self.index.features[r]["properties"]))].append(r)
+        return {value: Query(self.index, rows) for value, rows in groups.items()}
+
+    def count(self) -> int:
+        return len(self.rows)
+
+    def features(self) -> List[Dict[str, Any]]:
+        return [self.index.features[r] for r in self.rows]
+
+    def props(self, *fields: str) -> List[Dict[str, Any]]:
+        """Properties of each feature, limited to ``fields`` when given."""
+        out = []
+        for r in self.rows:
+            props = self.index.features[r]["properties"]
+            out.append({k: props.get(k) for k in fields} if fields else props)
+        return out
+
+    def first(self) -> Optional[Dict[str, Any]]:
+        return self.index.features[self.rows[0]] if self.rows else None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+# Loaded indexes by path, reloaded when the file changes on disk.
+_LOADED: Dict[str, Tuple[float, CampusIndex]] = {}
+
+
+def load_campus(path: str = CAMPUS_FILE) -> CampusIndex:
+    """Return the CampusIndex for ``path``, reading the file only once."""
+    mtime = os.path.getmtime(path)
+    cached = _LOADED.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, CampusIndex.load(path))
+        _LOADED[path] = cached
+    return cached[1]
+
+
+def _parse_value(text: str) -> Any:
+    # osm_id=123 and render=false should compare as JSON, names as text.
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Query public/campus.geojson")
+    parser.add_argument("--file", default=CAMPUS_FILE, help="GeoJSON to query")
+    parser.add_argument(
+        "--where",
+        nargs="+",
+        default=[],
+        metavar="KEY=VALUE",
+        help="keep features whose property equals VALUE (JSON or text)",
+    )
+    parser.add_argument(
+        "--bbox",
+        nargs=4,
+        type=float,
+        metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+        help="keep features intersecting this box",
+    )
+    parser.add_argument(
+        "--at",
+        nargs=2,
+        type=float,
+        metavar=("LON", "LAT"),
+        help="keep features containing this point",
+    )
+    parser.add_argument("--group-by", metavar="KEY", help="count features per value")
+    parser.add_argument(
+        "--fields",
+        nargs="+",
+        default=["id", "name", "category", "zone"],
+        metavar="KEY",
+        help="properties to print per feature (default: %(default)s)",
+    )
+    parser.add_argument("--count", action="store_true", help="only print the count")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    query = load_campus(args.file).query()
+    equals = {}
+    for item in args.where:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--where expects KEY=VALUE, got {item!r}")
+        equals[key] = _parse_value(value)
+    query = query.where(**equals)
+    if args.bbox:
+        query = query.bbox(*args.bbox)
+    if args.at:
+        query = query.at(*args.at)
+
+    if args.group_by:
+        counts = {
+            str(value): len(group)
+            for value, group in sorted(
+                query.group_by(args.group_by).items(),
+                key=lambda item: (-len(item[1]), str(item[0])),
+            )
+        }
+        if args.json:
+            print(json.dumps(counts, ensure_ascii=False, indent=2))
+        else:
+            for value, count in counts.items():
+                print(f"{count:6d}  {value}")
+    elif args.count:
+        print(query.count())
+    elif args.json:
+        print(json.dumps(query.props(*args.fields), ensure_ascii=False, indent=2))
+    else:
+        for props in query.props(*args.fields):
+            print("\t".join(str(props.get(k, "")) for k in args.fields))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import math
+import re
+from typing import Any, Dict, List
+
+# Must match the keys MapView passes to Fuse.
+SEARCH_KEYS: List[str] = ["properties.name", "properties.aliases"]
+
+_TOKEN_RE = re.compile(r"[^ ]+")
+
+
+def _norm(value: str, cache: Dict[int, float]) -> float:
+    # Fuse's field-length norm: 1 / sqrt(token count), rounded half up to 3
+    # places as JavaScript's Math.round does.
+    tokens = len(_TOKEN_RE.findall(value))
+    if tokens not in cache:
+        cache[tokens] = math.floor(1000 / math.sqrt(tokens) + 0.5) / 1000
+    return cache[tokens]
+
+
+def _get(doc: Dict[str, Any], path: List[str]) -> Any:
+    value: Any = doc
+    for key in path:
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+    return value
+
+
+def build_search_index(features: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return a Fuse.js 7 index over the features MapView searches.
+
+    The output is what ``Fuse.createIndex(SEARCH_KEYS, docs).toJSON()``
+    produces for the rendered features in file order, so the client can
+    pass ``Fuse.parseIndex(index)`` instead of indexing at startup. ``ids``
+    lists the feature id behind each record so the client can check that
+    the index lines up with the features it loaded.
+    """
+    docs = [f for f in features if f["properties"].get("render") is True]
+    keys = [
+        {
+            "path": key.split("."),
+            "id": key,
+            "weight": 1,
+            "src": key,
+            "getFn": None,
+        }
+        for key in SEARCH_KEYS
+    ]
+    cache: Dict[int, float] = {}
+    records = []
+    for i, doc in enumerate(docs):
+        fields: Dict[str, Any] = {}
+        for k, key in enumerate(keys):
+            value = _get(doc, key["path"])
+            if isinstance(value, list):
+                # Fuse walks arrays with a stack, so items come out reversed.
+                fields[str(k)] = [
+                    {"v": item, "i": j, "n": _norm(item, cache)}
+                    for j, item in reversed(list(enumerate(value)))
+                    if isinstance(item, str) and item.strip()
+                ]
+            elif isinstance(value, str) and value.strip():
+                fields[str(k)] = {"v": value, "n": _norm(value, cache)}
+        records.append({"i": i, "$": fields})
+    return {
+        "keys": keys,
+        "records": records,
+        "ids": [doc["properties"]["id"] for doc in docs],
+    }
+
+
+__all__ = ["SEARCH_KEYS", "build_search_index"]
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .cache import CACHE_DIR
+from .geometry import ElementKey, NodeStore, way_coords
+
+STATE_FILE: Path = CACHE_DIR / "build_state.pickle"
+STATE_VERSION: int = 1
+
+# Modules whose logic decides what a built feature looks like; editing any of
+# them invalidates every stored entry.
+_PIPELINE_MODULES: Tuple[str, ...] = (
+    "builder.py",
+    "classification.py",
+    "constants.py",
+    "geometry.py",
+    "utils.py",
+)
+
+
+def _digest(*parts: bytes) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+
+def _head(el: Dict[str, Any], *extra: Any) -> bytes:
+    return json.dumps(
+        [el.get("version"), el.get("tags", {}), *extra], sort_keys=True
+    ).encode()
+
+
+def element_fingerprints(
+    store: NodeStore,
+    ways: Dict[int, Dict[str, Any]],
+    rels: List[Dict[str, Any]],
+) -> Dict[ElementKey, str]:
+    """Fingerprint each way and relation from everything its feature uses.
+
+    Ways hash their version, tags and resolved node coordinates; relations
+    hash their version, tags, member list and member way fingerprints.
+    """
+    fingerprints: Dict[ElementKey, str] = {}
+    counts, coords, found = way_coords(ways, store)
+    coords[~found] = np.nan
+    start = 0
+    for (wid, way), count in zip(ways.items(), counts.tolist()):
+        block = coords[start : start + count]
+        start += count
+        fingerprints[("way", wid)] = _digest(_head(way), block.tobytes())
+
+    for rel in rels:
+        members = rel.get("members", [])
+        member_fps = [
+            fingerprints.get(("way", m.get("ref")), "missing")
+            for m in members
+            if m.get("type") == "way"
+        ]
+        fingerprints[("relation", rel["id"])] = _digest(
+            _head(rel, members), "".join(member_fps).encode()
+        )
+    return fingerprints
+
+
+def pipeline_signature(*context: str) -> str:
+    """Hash the pipeline source plus any build-wide context strings."""
+    package = Path(__file__).resolve().parent
+    parts = [str(STATE_VERSION).encode()]
+    parts.extend((package / name).read_bytes() for name in _PIPELINE_MODULES)
+    parts.extend(c.encode() for c in context)
+    return _digest(*parts)
+
+
+class BuildState:
+    """Built per-element results from the previous run, keyed by fingerprint.
+
+    Entries map ``(type, id)`` to ``(fingerprint, value)``. A build reads the
+    previous entries and writes a fresh set containing only the elements it
+    saw, so removed elements drop out automatically.
+    """
+
+    def __init__(
+        self,
+        signature: str = "",
+        entries: Optional[Dict[ElementKey, Tuple[str, Any]]] = None,
+    ) -> None:
+        self.signature = signature
+        self.entries: Dict[ElementKey, Tuple[str, Any]] = entries or {}
+        self._next: Dict[ElementKey, Tuple[str, Any]] = {}
+
+    @classmethod
+    def load(cls, path: Path = STATE_FILE) -> "BuildState":
+        if not path.exists():
+            return cls()
+        try:
+            with path.open("rb") as f:
+                version, signature, entries = pickle.load(f)
+        except Exception as e:
+            print(f"  Ignoring unreadable build state {path.name}: {e}")
+            return cls()
+        if version != STATE_VERSION:
+            return cls()
+        print(f"  Loaded build state with {len(entries)} entries")
+        return cls(signature, entries)
+
+    def save(self, path: Path = STATE_FILE) -> None:
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            pickle.dump(
+                (STATE_VERSION, self.signature, self.entries),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        tmp.replace(path)
+
+    def bind(self, signature: str) -> None:
+        """Drop every stored entry if the build signature changed."""
+        if signature != self.signature:
+            if self.entries:
+                print("  Pipeline or campus boundary changed; rebuilding all")
+            self.entries = {}
+            self.signature = signature
+        self._next = {}
+
+    def stale(self, fingerprints: Dict[ElementKey, str]) -> Set[ElementKey]:
+        """Return the keys whose stored fingerprint is missing or different."""
+        return {
+            key
+            for key, fp in fingerprints.items()
+            if self.entries.get(key, ("",))[0] != fp
+        }
+
+    def get(self, key: ElementKey) -> Any:
+        return self.entries[key][1]
+
+    def put(self, key: ElementKey, fingerprint: str, value: Any) -> None:
+        self._next[key] = (fingerprint, value)
+
+    def commit(self) -> None:
+        """Make the entries written during this build the stored state."""
+        self.entries = self._next
+        self._next = {}
+
+
+__all__ = ["BuildState", "element_fingerprints", "pipeline_signature"]
@@ -0,0 +1,184 @@
+import math
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .builder import CAMPUS_WAY_ID
+from .constants import BBOX
+
+# Roughly the number of ways and relations in the real UCLA extract
+BASE_FEATURES: int = 1500
+
+# Tag mixes chosen to reach most CLASSIFICATION rules; "{n}" is replaced
+# with a running number so names stay unique.
+TAG_MIXES: List[Dict[str, str]] = [
+    {"building": "university", "name": "{n} Hall"},
+    {"building": "yes", "name": "Bradley {n} Lab"},
+    {"building": "yes"},
+    {"building": "yes", "name": "Building in Lot {n}"},
+    {"building": "dormitory", "name": "Residence {n}"},
+    {"building": "house", "name": "Faculty House {n}"},
+    {"building": "apartments", "name": "Apartments {n}"},
+    {"building": "retail", "name": "Store {n}"},
+    {"building": "office", "name": "Campus Services {n}"},
+    {"building": "warehouse"},
+    {"building": "greenhouse"},
+    {"building": "roof"},
+    {"building": "auditorium", "name": "Auditorium {n}"},
+    {"building": "yes", "name": "Student Union {n}"},
+    {"building": "yes", "name": "Alpha Tau Omega {n}", "building:use": "fraternity"},
+    {"building": "yes", "name": "Sorority {n}", "building:use": "sorority"},
+    {"amenity": "library", "building": "yes", "name": "Library {n}"},
+    {"amenity": "parking", "parking": "surface", "name": "Lot {n}"},
+    {"amenity": "parking", "name": "Parking Structure {n}"},
+    {"amenity": "parking"},
+    {"healthcare": "clinic", "building": "yes", "name": "Clinic {n}"},
+    {"amenity": "research_institute", "name": "Institute {n}"},
+    {"leisure": "pitch", "sport": "tennis"},
+    {"leisure": "pitch", "sport": "soccer", "name": "Field {n}"},
+    {"leisure": "pitch", "sport": "softball"},
+    {"leisure": "pitch"},
+    {"leisure": "track", "name": "Track {n}"},
+    {"leisure": "swimming_pool", "name": "Pool {n}"},
+    {"leisure": "fitness_centre", "name": "Gym {n}"},
+    {"leisure": "garden", "name": "Garden {n}"},
+    {"leisure": "park", "name": "Park {n}"},
+    {"landuse": "grass"},
+    {"landuse": "recreation_ground", "name": "Rec {n}"},
+    {"natural": "wood"},
+    {"shop": "convenience", "building": "yes", "name": "Shop {n}"},
+    {"amenity": "school", "name": "UCLA Lab School {n}"},
+]
+
+
+class _Builder:
+    def __init__(self) -> None:
+        self.nodes: List[Dict[str, Any]] = []
+        self.ways: List[Dict[str, Any]] = []
+        self.relations: List[Dict[str, Any]] = []
+        self.next_node = 1
+        self.next_way = 1_000_000
+        self.next_rel = 1
+
+    def node_ids(self, coords: Sequence[Tuple[float, float]]) -> List[int]:
+        ids = []
+        for lon, lat in coords:
+            self.nodes.append(
+                {"type": "node", "id": self.next_node, "lat": lat, "lon": lon}
+            )
+            ids.append(self.next_node)
+            self.next_node += 1
+        return ids
+
+    def way(
+        self,
+        coords: Sequence[Tuple[float, float]],
+        tags: Optional[Dict[str, str]] = None,
+        closed: bool = True,
+        way_id: Optional[int] = None,
+    ) -> int:
+        ids = self.node_ids(coords)
+        if closed:
+            ids.append(ids[0])
+        if way_id is None:
+            way_id = self.next_way
+            self.next_way += 1
+        way: Dict[str, Any] = {"type": "way", "id": way_id, "nodes": ids}
+        if tags:
+            way["tags"] = tags
+        self.ways.append(way)
+        return way_id
+
+    def relation(
+        self, members: List[Tuple[int, str]], tags: Dict[str, str]
+    ) -> None:
+        self.relations.append(
+            {
+                "type": "relation",
+                "id": self.next_rel,
+                "members": [
+                    {"type": "way", "ref": ref, "role": role}
+                    for ref, role in members
+                ],
+                "tags": {"type": "multipolygon", **tags},
+            }
+        )
+        self.next_rel += 1
+
+
+def _rect(
+    x0: float, y0: float, w: float, h: float, steps: int = 1
+) -> List[Tuple[float, float]]:
+    """Counter-clockwise rectangle with ``steps`` points per side."""
+    corners = [(x0, y0), (x0 + w, y0), (x0 + w, y0 + h), (x0, y0 + h)]
+    coords = []
+    for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+        for k in range(steps):
+            t = k / steps
+            coords.append((ax + (bx - ax) * t, ay + (by - ay) * t))
+    return coords
+
+
+def _tags(rnd: random.Random, n: int) -> Dict[str, str]:
+    return {
+        k: v.replace("{n}", str(n)) for k, v in rnd.choice(TAG_MIXES).items()
+    }
+
+
+def generate_osm(scale: float = 1.0, seed: int = 0) -> Dict[str, Any]:
+    """Return a deterministic Overpass-shaped dataset ``scale`` times UCLA.
+
+    Features are laid out on a grid that grows around BBOX with the square
+    root of ``scale``; the middle of the original bounding box is covered by
+    a campus boundary way with CAMPUS_WAY_ID. About a quarter of the
+    features get a nested child building and one in twenty is a multipolygon
+    relation whose outer ring is split over two open ways and that has an
+    inner hole. Elements are listed as Overpass does: ways, relations, then
+    nodes.
+    """
+    rnd = random.Random(seed)
+    b = _Builder()
+    south, west, north, east = BBOX
+    grow = math.sqrt(max(scale, 1e-6))
+    width = (east - west) * grow
+    height = (north - south) * grow
+    x_min = (west + east) / 2 - width / 2
+    y_min = (south + north) / 2 - height / 2
+
+    campus = _rect(
+        west + 0.002, south + 0.004, east - west - 0.006, north - south - 0.006
+    )
+    b.way(campus, {"amenity": "university", "name": "UCLA"}, way_id=CAMPUS_WAY_ID)
+
+    count = max(1, int(BASE_FEATURES * scale))
+    side = math.ceil(math.sqrt(count))
+    dx = width / side
+    dy = height / side
+    for k in range(count):
+        row, col = divmod(k, side)
+        x0 = x_min + col * dx + dx * 0.1
+        y0 = y_min + row * dy + dy * 0.1
+        w = dx * rnd.uniform(0.3, 0.8)
+        h = dy * rnd.uniform(0.3, 0.8)
+        steps = rnd.choice((1, 1, 2, 4))
+        roll = rnd.random()
+        if roll < 0.05:
+            ring = _rect(x0, y0, w, h, steps=2)
+            half = len(ring) // 2
+            first = b.way(ring[: half + 1], closed=False)
+            second = b.way(ring[half:] + ring[:1], closed=False)
+            inner = b.way(_rect(x0 + w * 0.3, y0 + h * 0.3, w * 0.4, h * 0.4))
+            b.relation(
+                [(first, "outer"), (second, "outer"), (inner, "inner")],
+                {"building": "yes", "name": f"Court {k}"},
+            )
+            continue
+        b.way(_rect(x0, y0, w, h, steps), _tags(rnd, k))
+        if roll < 0.30:
+            b.way(
+                _rect(x0 + w * 0.2, y0 + h * 0.2, w * 0.4, h * 0.4),
+                {"building": "yes"},
+            )
+    return {"elements": b.ways + b.relations + b.nodes}
+
+
+__all__ = ["BASE_FEATURES", "generate_osm"]
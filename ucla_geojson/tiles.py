@@ -0,0 +1,247 @@
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import MultiPolygon, Polygon, shape
+from shapely.geometry.base import BaseGeometry
+from shapely.geometry.polygon import orient
+
+from .constants import (
+    TILE_BUFFER,
+    TILE_EXTENT,
+    TILE_MAX_ZOOM,
+    TILE_MIN_ZOOM,
+    TILE_PROPERTIES,
+)
+from .geometry import simplify_coverage_m
+
+TILE_DIR: str = "public/tiles"
+LAYER_NAME: str = "campus"
+
+_EARTH_RADIUS_M = 6378137.0
+_WORLD_M = 2 * math.pi * _EARTH_RADIUS_M
+_ORIGIN_M = _WORLD_M / 2
+
+TileKey = Tuple[int, int, int]
+
+
+# Minimal protobuf writer for the Mapbox Vector Tile 2.1 schema.
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _uint_field(field: int, value: int) -> bytes:
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes_field(field: int, data: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed_field(field: int, values: Sequence[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _value(value: Any) -> bytes:
+    """Encode a tile property value as an MVT Value message."""
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int):
+        return _key(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + np.float64(value).tobytes()
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def _ring_commands(ring: np.ndarray, cursor: List[int]) -> List[int]:
+    # MoveTo the first vertex, LineTo the rest bar the closing one, ClosePath.
+    cmds = [(1 << 3) | 1]
+    x0, y0 = cursor
+    for i, (x, y) in enumerate(ring[:-1].tolist()):
+        if i == 1:
+            cmds.append(((len(ring) - 2) << 3) | 2)
+        cmds += [_zigzag(x - x0), _zigzag(y - y0)]
+        x0, y0 = x, y
+    cursor[:] = [x0, y0]
+    cmds.append((1 << 3) | 7)
+    return cmds
+
+
+def _polygon_commands(geom: BaseGeometry) -> List[int]:
+    cmds: List[int] = []
+    cursor = [0, 0]
+    polys = geom.geoms if isinstance(geom, MultiPolygon) else [geom]
+    for poly in polys:
+        # Tile y points down, so the exterior ring must have positive area in
+        # tile coordinates and holes negative area.
+        poly = orient(poly, sign=1.0)
+        for ring in [poly.exterior, *poly.interiors]:
+            cmds += _ring_commands(np.asarray(ring.coords, dtype=np.int64), cursor)
+    return cmds
+
+
+def encode_tile(features: Sequence[Tuple[BaseGeometry, Dict[str, Any]]]) -> bytes:
+    """Encode (tile-coordinate geometry, properties) pairs as one MVT layer."""
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    encoded = []
+    for geom, props in features:
+        tags = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v), v), len(values)))
+        encoded.append(
+            _bytes_field(
+                2,
+                _packed_field(2, tags)
+                + _uint_field(3, 3)  # POLYGON
+                + _packed_field(4, _polygon_commands(geom)),
+            )
+        )
+    layer = (
+        _uint_field(15, 2)
+        + _bytes_field(1, LAYER_NAME.encode("utf-8"))
+        + b"".join(encoded)
+        + b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys)
+        + b"".join(_bytes_field(4, _value(v)) for _, v in values)
+        + _uint_field(5, TILE_EXTENT)
+    )
+    return _bytes_field(3, layer)
+
+
+# Tiling
+
+
+def _to_mercator(geoms: np.ndarray) -> np.ndarray:
+    def project(xy: np.ndarray) -> np.ndarray:
+        x = np.radians(xy[:, 0]) * _EARTH_RADIUS_M
+        y = np.log(np.tan(np.pi / 4 + np.radians(xy[:, 1]) / 2)) * _EARTH_RADIUS_M
+        return np.column_stack([x, y])
+
+    return shapely.transform(geoms, project)
+
+
+def _polygonal(geom: BaseGeometry) -> Optional[BaseGeometry]:
+    """Drop the lines and points clipping leaves where a polygon grazes a tile."""
+    if geom.is_empty:
+        return None
+    if isinstance(geom, (Polygon, MultiPolygon)):
+        return geom
+    polys = [
+        p for p in shapely.get_parts(geom) if isinstance(p, (Polygon, MultiPolygon))
+    ]
+    if not polys:
+        return None
+    return shapely.union_all(polys)
+
+
+def _tile_pairs(bounds: np.ndarray, z: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (feature index, tile x*2^z+y) for every tile a feature touches."""
+    n = 2**z
+    span = _WORLD_M / n
+    pad = span * TILE_BUFFER / TILE_EXTENT
+    x0 = np.floor((bounds[:, 0] - pad + _ORIGIN_M) / span).astype(np.int64)
+    x1 = np.floor((bounds[:, 2] + pad + _ORIGIN_M) / span).astype(np.int64)
+    y0 = np.floor((_ORIGIN_M - bounds[:, 3] - pad) / span).astype(np.int64)
+    y1 = np.floor((_ORIGIN_M - bounds[:, 1] + pad) / span).astype(np.int64)
+    idx, tiles = [], []
+    for i, (a, b, c, d) in enumerate(
+        zip(x0.tolist(), x1.tolist(), y0.tolist(), y1.tolist())
+    ):
+        for x in range(max(a, 0), min(b, n - 1) + 1):
+            for y in range(max(c, 0), min(d, n - 1) + 1):
+                idx.append(i)
+                tiles.append(x * n + y)
+    return np.array(idx, dtype=np.int64), np.array(tiles, dtype=np.int64)
+
+
+def iter_tiles(
+    features: List[Dict[str, Any]],
+    min_zoom: int = TILE_MIN_ZOOM,
+    max_zoom: int = TILE_MAX_ZOOM,
+) -> Iterator[Tuple[TileKey, bytes]]:
+    """Yield ((z, x, y), encoded tile) for the features at every zoom.
+
+    Per zoom the features are simplified together to one tile unit (keeping
+    shared walls shared, see simplify_coverage_m), clipped to each tile they
+    touch plus a TILE_BUFFER margin and snapped to the integer tile grid.
+    """
+    geoms = _to_mercator(
+        np.array([shape(f["geometry"]) for f in features], dtype=object)
+    )
+    props = [
+        {k: f["properties"].get(k) for k in TILE_PROPERTIES} for f in features
+    ]
+    for z in range(min_zoom, max_zoom + 1):
+        n = 2**z
+        span = _WORLD_M / n
+        unit = span / TILE_EXTENT
+        simplified = simplify_coverage_m(geoms, unit)
+        idx, tiles = _tile_pairs(shapely.bounds(simplified), z)
+        tx, ty = np.divmod(tiles, n)
+        left = tx * span - _ORIGIN_M
+        top = _ORIGIN_M - ty * span
+        pad = TILE_BUFFER * unit
+        clipped = shapely.intersection(
+            simplified[idx],
+            shapely.box(left - pad, top - span - pad, left + span + pad, top + pad),
+        )
+        # Into tile units: origin at the top-left corner, y pointing down.
+        coords, owner = shapely.get_coordinates(clipped, return_index=True)
+        coords = np.column_stack(
+            [
+                (coords[:, 0] - left[owner]) / unit,
+                (top[owner] - coords[:, 1]) / unit,
+            ]
+        )
+        clipped = shapely.set_coordinates(clipped, coords)
+        clipped = shapely.set_precision(clipped, 1.0)
+        by_tile: Dict[int, List[Any]] = defaultdict(list)
+        for i, tile, geom in zip(idx.tolist(), tiles.tolist(), clipped):
+            geom = _polygonal(geom)
+            if geom is not None:
+                by_tile[tile].append((geom, props[i]))
+        for tile in sorted(by_tile):
+            x, y = divmod(tile, n)
+            yield (z, x, y), encode_tile(by_tile[tile])
+
+
+def tilejson() -> Dict[str, Any]:
+    """TileJSON describing the pyramid iter_tiles produces under TILE_DIR."""
+    return {
+        "tilejson": "3.0.0",
+        "tiles": ["/tiles/{z}/{x}/{y}.pbf"],
+        "minzoom": TILE_MIN_ZOOM,
+        "maxzoom": TILE_MAX_ZOOM,
+        "vector_layers": [
+            {
+                "id": LAYER_NAME,
+                "fields": TILE_PROPERTIES,
+                "minzoom": TILE_MIN_ZOOM,
+                "maxzoom": TILE_MAX_ZOOM,
+            }
+        ],
+        "attribution": "© OpenStreetMap contributors",
+    }
+
+
+__all__ = ["TILE_DIR", "encode_tile", "iter_tiles", "tilejson"]
@@ -0,0 +1,144 @@
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+Point = Tuple[int, int]
+
+
+def _quantize_ring(
+    ring: Sequence[Sequence[float]], translate: Tuple[float, float], scale: float
+) -> List[Point]:
+    points: List[Point] = []
+    for x, y in ring:
+        p = (round((x - translate[0]) / scale), round((y - translate[1]) / scale))
+        if not points or p != points[-1]:
+            points.append(p)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _polygons(geometry: Dict[str, Any]) -> List[List[List[List[float]]]]:
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def _junctions(rings: List[List[Point]]) -> Set[Point]:
+    """Points where rings meet or part ways: the arc cut points.
+
+    A point is a junction when two visits to it do not share the same pair
+    of neighbours, i.e. the boundary through it is not the same edge.
+    """
+    neighbours: Dict[Point, Tuple[Point, Point]] = {}
+    junctions: Set[Point] = set()
+    for ring in rings:
+        n = len(ring)
+        for i, p in enumerate(ring):
+            a, b = ring[i - 1], ring[(i + 1) % n]
+            pair = (a, b) if a <= b else (b, a)
+            seen = neighbours.setdefault(p, pair)
+            if seen != pair:
+                junctions.add(p)
+    return junctions
+
+
+class _Arcs:
+    """Deduplicated arcs; a reversed match is referenced as ``~index``."""
+
+    def __init__(self) -> None:
+        self.arcs: List[List[Point]] = []
+        self.index: Dict[Tuple[Point, ...], int] = {}
+
+    def add(self, arc: List[Point]) -> int:
+        key = tuple(arc)
+        if key in self.index:
+            return self.index[key]
+        rev = key[::-1]
+        if rev in self.index:
+            return ~self.index[rev]
+        self.index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return len(self.arcs) - 1
+
+
+def _ring_arcs(ring: List[Point], junctions: Set[Point], arcs: _Arcs) -> List[int]:
+    cuts = [i for i, p in enumerate(ring) if p in junctions]
+    if not cuts:
+        # A ring nobody shares: start it at its smallest point so identical
+        # rings (duplicate features) still collapse into one arc.
+        start = min(range(len(ring)), key=ring.__getitem__)
+        return [arcs.add(ring[start:] + ring[: start + 1])]
+    loop = ring[cuts[0] :] + ring[: cuts[0]] + [ring[cuts[0]]]
+    offsets = [c - cuts[0] for c in cuts] + [len(ring)]
+    return [arcs.add(loop[a : b + 1]) for a, b in zip(offsets, offsets[1:])]
+
+
+def _delta(arc: List[Point]) -> List[List[int]]:
+    out = [list(arc[0])]
+    for (x0, y0), (x1, y1) in zip(arc, arc[1:]):
+        out.append([x1 - x0, y1 - y0])
+    return out
+
+
+def to_topology(
+    features: List[Dict[str, Any]], precision: int, name: str = "campus"
+) -> Dict[str, Any]:
+    """Encode polygon features as a quantized, delta-encoded TopoJSON Topology.
+
+    Coordinates are snapped to ``10**-precision`` degrees and every boundary
+    shared by neighbouring features is stored once as an arc.
+    """
+    scale = 10.0**-precision
+    xs = [
+        x
+        for f in features
+        for poly in _polygons(f["geometry"])
+        for ring in poly
+        for x, _ in ring
+    ]
+    ys = [
+        y
+        for f in features
+        for poly in _polygons(f["geometry"])
+        for ring in poly
+        for _, y in ring
+    ]
+    translate = (
+        round(min(xs, default=0.0), precision),
+        round(min(ys, default=0.0), precision),
+    )
+    shapes = [
+        [
+            [_quantize_ring(ring, translate, scale) for ring in poly]
+            for poly in _polygons(f["geometry"])
+        ]
+        for f in features
+    ]
+    # Rings that snapping collapsed below a triangle are dropped.
+    shapes = [
+        [[r for r in poly if len(r) >= 3] for poly in polys if len(poly[0]) >= 3]
+        for polys in shapes
+    ]
+    junctions = _junctions([r for polys in shapes for poly in polys for r in poly])
+
+    arcs = _Arcs()
+    geometries = []
+    for f, polys in zip(features, shapes):
+        refs = [[_ring_arcs(r, junctions, arcs) for r in poly] for poly in polys]
+        geometry: Dict[str, Any]
+        if not refs:
+            geometry = {"type": None}
+        elif f["geometry"]["type"] == "Polygon" and len(refs) == 1:
+            geometry = {"type": "Polygon", "arcs": refs[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "arcs": refs}
+        geometry["properties"] = f["properties"]
+        geometries.append(geometry)
+    return {
+        "type": "Topology",
+        "transform": {"scale": [scale, scale], "translate": list(translate)},
+        "objects": {name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": [_delta(arc) for arc in arcs.arcs],
+    }
+
+
+__all__ = ["to_topology"]
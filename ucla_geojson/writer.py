@@ -1,15 +1,361 @@
+import gzip
+import hashlib
 import json
 import os
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
+from .constants import COORD_PRECISION, PATCH_HISTORY
+from .delta import CHAIN_PATH, PATCH_DIR, diff_features, extend_chain, load_chain
+from .metrics import stage
+from .search import build_search_index
+from .tiles import TILE_DIR, iter_tiles, tilejson
+from .topojson import to_topology
 
-def write_single(features: List[Dict[str, Any]]) -> None:
+try:
+    import brotli
+except ImportError:  # .br sidecars are optional
+    brotli = None
+
+
+MANIFEST_PATH: str = "public/manifest.json"
+
+
+def lod_path(tol_m: float) -> str:
+    return f"public/campus.lod{tol_m:g}m.geojson"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    # Readers (the dev server, a CDN sync) never see a half-written file.
+    tmp = f"{path}.part"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _round_coords(coords: Any, precision: int) -> Any:
+    if isinstance(coords[0], (int, float)):
+        return [round(c, precision) for c in coords]
+    return [_round_coords(c, precision) for c in coords]
+
+
+def _quantize(features: List[Dict[str, Any]], precision: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            **f,
+            "geometry": {
+                "type": f["geometry"]["type"],
+                "coordinates": _round_coords(f["geometry"]["coordinates"], precision),
+            },
+        }
+        for f in features
+    ]
+
+
+class OutputManifest:
+    """ETags of the files in public/, used to skip rewriting unchanged ones.
+
+    The manifest of the previous build is read back on creation; publish()
+    only touches a file whose content hash differs from the one recorded
+    there (or that is missing), so unchanged outputs keep their mtime and
+    HTTP validators. save() removes files the previous build listed that this
+    one did not.
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH) -> None:
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.written = 0
+        self.skipped = 0
+        self.removed = 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.previous: Dict[str, Dict[str, Any]] = json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            self.previous = {}
+
+    def publish(self, path: str, data: bytes) -> None:
+        name = os.path.relpath(path, os.path.dirname(self.path))
+        etag = f'"{content_hash(data)}"'
+        self.files[name] = {"etag": etag, "bytes": len(data)}
+        old = self.previous.get(name, {})
+        if (
+            old.get("etag") == etag
+            and os.path.exists(path)
+            and os.path.getsize(path) == len(data)
+        ):
+            self.skipped += 1
+            return
+        _atomic_write(path, data)
+        self.written += 1
+
+    def keep(self, path: str) -> None:
+        """Carry a file written by an earlier build over into this manifest."""
+        for suffix in ("", ".gz", ".br"):
+            name = os.path.relpath(path + suffix, os.path.dirname(self.path))
+            if name in self.files:
+                # Published again by this build; its new entry stands.
+                continue
+            if name in self.previous and os.path.exists(path + suffix):
+                self.files[name] = self.previous[name]
+
+    def save(self, collection_hash: str) -> None:
+        """Write the manifest and delete outputs this build no longer produces.
+
+        A file listed by the previous build but neither published nor kept
+        now (say campus.geojson.gz after switching off --compact) would
+        otherwise be left behind holding stale data.
+        """
+        root = os.path.dirname(self.path)
+        for name in sorted(self.previous.keys() - self.files.keys()):
+            path = os.path.join(root, name)
+            if os.path.exists(path):
+                os.remove(path)
+                self.removed += 1
+            # Drop directories emptied this way, such as a tile column.
+            parent = os.path.dirname(path)
+            while parent != root and os.path.isdir(parent) and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+        manifest = {"hash": collection_hash, "files": self.files}
+        data = json.dumps(
+            manifest, ensure_ascii=False, indent=2, sort_keys=True
+        ).encode("utf-8")
+        try:
+            with open(self.path, "rb") as f:
+                if f.read() == data:
+                    return
+        except OSError:
+            pass
+        _atomic_write(self.path, data)
+
+
+def _write_json(path: str, obj: Any, compact: bool, manifest: OutputManifest) -> int:
+    """Publish ``obj``; compact output is minified with .gz/.br copies."""
+    if compact:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(obj, ensure_ascii=False, indent=2)
+    data = text.encode("utf-8")
+    manifest.publish(path, data)
+    if compact:
+        # mtime=0 keeps the .gz byte-identical across builds of the same data.
+        manifest.publish(
+            f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0)
+        )
+        if brotli is not None:
+            manifest.publish(f"{path}.br", brotli.compress(data, quality=11))
+    return len(data)
+
+
+def _load_previous(path: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """Return the collection hash and features of the previously written file."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            fc = json.load(f)
+        return fc.get("hash"), fc["features"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, []
+
+
+def stamp_features(
+    features: List[Dict[str, Any]], previous: List[Dict[str, Any]]
+) -> str:
+    """Set each feature's content ``hash`` and carry ``updated_at`` over.
+
+    The hash covers the geometry and every property except ``updated_at``
+    and ``hash``; a feature whose hash matches its namesake (by id) in
+    ``previous`` keeps that ``updated_at``. Returns the collection hash.
+    """
+    stamps = {
+        f["properties"].get("id"): (
+            f["properties"].get("hash"),
+            f["properties"].get("updated_at"),
+        )
+        for f in previous
+    }
+    hashes = []
+    for f in features:
+        props = f["properties"]
+        body = {
+            "geometry": f["geometry"],
+            "properties": {
+                k: v for k, v in props.items() if k not in ("hash", "updated_at")
+            },
+        }
+        digest = content_hash(
+            json.dumps(
+                body, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+            ).encode("utf-8")
+        )
+        old_hash, old_updated_at = stamps.get(props["id"], (None, None))
+        if old_hash == digest and old_updated_at:
+            props["updated_at"] = old_updated_at
+        props["hash"] = digest
+        hashes.append(digest)
+    return content_hash("\n".join(hashes).encode("utf-8"))
+
+
+def _write_patch(
+    previous_hash: Optional[str],
+    previous: List[Dict[str, Any]],
+    collection_hash: str,
+    features: List[Dict[str, Any]],
+    compact: bool,
+    manifest: OutputManifest,
+) -> Dict[str, int]:
+    """Write the delta from the previous build and extend the version chain."""
+    chain = load_chain()
+    patches = [v["patch"] for v in chain["versions"] if v.get("patch")]
+    if chain.get("latest") == collection_hash:
+        # Nothing changed; the existing chain and patches stay as they are.
+        for name in patches:
+            manifest.keep(f"public/{name}")
+        manifest.keep(CHAIN_PATH)
+        return {}
+    os.makedirs(PATCH_DIR, exist_ok=True)
+    patch_name = None
+    size = 0
+    counts: Dict[str, int] = {}
+    if previous_hash and previous_hash != collection_hash:
+        patch = diff_features(previous, features)
+        patch = {"from": previous_hash, "to": collection_hash, **patch}
+        patch_name = f"patches/{previous_hash[:16]}-{collection_hash[:16]}.json"
+        size = _write_json(f"public/{patch_name}", patch, compact, manifest)
+        counts = {
+            "added": len(patch["added"]),
+            "removed": len(patch["removed"]),
+            "changed": len(patch["changed"]),
+            "bytes": size,
+        }
+        print(
+            f"  Patch from {previous_hash[:12]}: {counts['added']} added, "
+            f"{counts['removed']} removed, {counts['changed']} changed "
+            f"({size} bytes)"
+        )
+    dropped = extend_chain(
+        chain, previous_hash, collection_hash, patch_name, size, PATCH_HISTORY
+    )
+    for name in dropped:
+        for suffix in ("", ".gz", ".br"):
+            path = f"public/{name}{suffix}"
+            if os.path.exists(path):
+                os.remove(path)
+    for name in patches:
+        if name not in dropped:
+            manifest.keep(f"public/{name}")
+    _write_json(CHAIN_PATH, chain, False, manifest)
+    return counts
+
+
+def _write_tiles(
+    features: List[Dict[str, Any]], manifest: OutputManifest
+) -> Dict[str, int]:
+    """Publish the vector tile pyramid and its TileJSON under TILE_DIR."""
+    count = 0
+    total = 0
+    for (z, x, y), data in iter_tiles(features):
+        path = f"{TILE_DIR}/{z}/{x}/{y}.pbf"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        manifest.publish(path, data)
+        count += 1
+        total += len(data)
+    _write_json(f"{TILE_DIR}/tiles.json", tilejson(), False, manifest)
+    print(f"  Published {count} tiles ({total / 1024:.0f} KiB)")
+    return {"tiles": count, "bytes": total}
+
+
+def write_single(
+    features: List[Dict[str, Any]],
+    compact: bool = False,
+    precision: int = COORD_PRECISION,
+    tiles: bool = False,
+) -> None:
+    """Write campus.geojson, its levels of detail, search index and attribution.
+
+    Output is deterministic: features carry a content ``hash`` and keep the
+    previous build's ``updated_at`` unless they changed, the collection hash
+    and per-file ETags go to manifest.json, and files whose content did not
+    change are left untouched.
+
+    ``compact`` quantizes coordinates to ``precision`` decimal places, minifies
+    the JSON, adds a campus.topojson whose shared boundaries are stored once,
+    and writes precompressed .gz (and, with the brotli package, .br) copies.
+    ``tiles`` also publishes a vector tile pyramid under public/tiles.
+    """
     print("Writing output files...")
     os.makedirs("public", exist_ok=True)
-    fc = {"type": "FeatureCollection", "features": features}
-    with open("public/campus.geojson", "w", encoding="utf-8") as f:
-        json.dump(fc, f, ensure_ascii=False, indent=2)
-    with open("public/attribution.txt", "w", encoding="utf-8") as f:
-        f.write(
-            "© OpenStreetMap contributors — Data: ODbL 1.0 (opendatacommons.org/licenses/odbl/)"
+    manifest = OutputManifest()
+    lods = features[0].get("lods", {}) if features else {}
+    base = [
+        {
+            **{k: v for k, v in f.items() if k != "lods"},
+            "properties": dict(f["properties"]),
+        }
+        for f in features
+    ]
+    if compact:
+        base = _quantize(base, precision)
+    previous_hash, previous = _load_previous("public/campus.geojson")
+    collection_hash = stamp_features(base, previous)
+    fc = {"type": "FeatureCollection", "hash": collection_hash, "features": base}
+    with stage("write_geojson") as counts:
+        size = _write_json("public/campus.geojson", fc, compact, manifest)
+        counts.update(features=len(features), bytes=size)
+    for tol in lods:
+        # Same features and properties, coarser geometry for low zooms.
+        path = lod_path(tol)
+        # The content hash describes the full-detail geometry, so it is not
+        # carried over to the coarser copy.
+        lod_features = [
+            {
+                **f,
+                "properties": {
+                    k: v for k, v in f["properties"].items() if k != "hash"
+                },
+                "geometry": src["lods"][tol],
+            }
+            for f, src in zip(base, features)
+        ]
+        if compact:
+            lod_features = _quantize(lod_features, precision)
+        fc = {"type": "FeatureCollection", "features": lod_features}
+        with stage(f"write_lod_{tol:g}m") as counts:
+            size = _write_json(path, fc, compact, manifest)
+            counts.update(features=len(features), bytes=size)
+    with stage("write_search_index") as counts:
+        index = build_search_index(base)
+        size = _write_json("public/campus.search.json", index, compact, manifest)
+        counts.update(records=len(index["records"]), bytes=size)
+    if compact:
+        with stage("write_topojson") as counts:
+            topology = to_topology(base, precision)
+            size = _write_json("public/campus.topojson", topology, compact, manifest)
+            counts.update(arcs=len(topology["arcs"]), bytes=size)
+    attribution = (
+        "© OpenStreetMap contributors — Data: ODbL 1.0 "
+        "(opendatacommons.org/licenses/odbl/)"
+    )
+    manifest.publish("public/attribution.txt", attribution.encode("utf-8"))
+    if tiles:
+        with stage("write_tiles") as counts:
+            counts.update(_write_tiles(features, manifest))
+    with stage("write_patch") as counts:
+        counts.update(
+            _write_patch(
+                previous_hash, previous, collection_hash, base, compact, manifest
+            )
         )
+    manifest.save(collection_hash)
+    print(
+        f"  Wrote {manifest.written} file(s), left {manifest.skipped} unchanged, "
+        f"removed {manifest.removed} (collection {collection_hash[:12]})"
+    )